@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from fastapi import Response
+from api.db import get_generations
+from api.encoding import encode_json, validate
+from api.executor import run_query
+
+# Generations are re-read at most this often; an ingest becomes visible
+# to cached routes within this window.
+GENERATION_TTL_SECONDS = 2
+
+# Upper bound on cached responses per worker (LRU)
+MAX_ENTRIES = 512
+
+class GenerationClock:
+    """
+    Throttled view of meta_source_generation so cache hits don't need a
+    DuckDB round trip every time.
+    """
+
+    def __init__(self, ttl=GENERATION_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._generations = {}
+        self._read_at = 0.0
+
+    def peek(self, sources):
+        """
+        Returns the generations of `sources`, or None if they are stale.
+        """
+        with self._lock:
+            if time.monotonic() - self._read_at > self.ttl:
+                return None
+            return tuple(self._generations.get(s, 0) for s in sources)
+
+    def refresh(self, conn, sources):
+        generations = get_generations(conn)
+        with self._lock:
+            self._generations = generations
+            self._read_at = time.monotonic()
+        return tuple(generations.get(s, 0) for s in sources)
+
+class ResponseCache:
+    """
+    LRU of encoded JSON responses keyed on route, query params and the
+    generations of the sources the route reads. An ingest of one source
+    only changes the keys of routes that depend on it; their old entries
+    simply age out.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+generation_clock = GenerationClock()
+response_cache = ResponseCache()
+
+def _etag_matches(request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+async def cached_response(request, sources, compute, lane="light", name=None, model=None):
+    """
+    Serves `compute(conn)` through the response cache.
+
+    `sources` are the ingest sources the route reads (see
+    meta_source_generation). The ETag is derived from the cache key, so a
+    matching If-None-Match gets a 304 without touching the warehouse.
+    Misses run `compute` on the query executor in `lane`, recorded
+    under `name` in the query metrics, and are encoded with orjson
+    (checked against `model` only in validation mode).
+    """
+    generations = generation_clock.peek(sources)
+    if generations is None:
+        generations = await run_query(request, generation_clock.refresh, sources, name="generations")
+    params = tuple(sorted(request.query_params.multi_items()))
+    key = (request.url.path, params, generations)
+    etag = '"' + hashlib.sha1(repr(key).encode()).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    body = response_cache.get(key)
+    if body is None:
+        data = await run_query(request, compute, lane=lane, name=name)
+        body = encode_json(validate(model, data))
+        response_cache.put(key, body)
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,24 +1,300 @@
 import duckdb
 import os
+import glob
+import shutil
+import threading
+import logging
+from datetime import datetime
 from contextlib import contextmanager
+from api.profiling import slow_query_log, ProfiledCursor
 
-DB_PATH = "stabletrace.duckdb"
+logger = logging.getLogger(__name__)
+
+# Override to point the API and ingest at another database (e.g. benchmarks)
+DB_PATH = os.getenv("STABLETRACE_DB_PATH", "stabletrace.duckdb")
 SCHEMA_PATH = "warehouse/schema.sql"
+WAREHOUSE_ALIAS = "warehouse"
+
+# Published snapshots kept on disk (the current one plus the previous,
+# which API workers may still be reading)
+SNAPSHOT_RETENTION = 2
+
+# Staging snapshot of the active publish_snapshot() session, if any
+_write_path = None
+
+def pointer_path(path=DB_PATH):
+    return path + ".current"
+
+def resolve_db_path(path=DB_PATH):
+    """
+    Returns the published snapshot that `path` refers to. Ingest publishes
+    versioned files (stabletrace.<version>.duckdb) and names the current
+    one in a pointer file; before the first publish it is `path` itself.
+    """
+    try:
+        with open(pointer_path(path)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return path
+    return os.path.join(os.path.dirname(path), name)
 
 def get_db_connection(read_only=False):
     """
-    Returns a DuckDB connection.
-    In the real world, you might want a connection pool or careful management 
-    of the single file lock if writing.
+    Returns a fresh DuckDB connection.
+    Used by the ingest connectors and scripts. Inside publish_snapshot()
+    it opens the session's staging copy, otherwise the current snapshot.
+    API handlers should use the shared read pool (`read_pool` /
+    `get_cursor`) instead.
     """
-    conn = duckdb.connect(DB_PATH, read_only=read_only)
+    conn = duckdb.connect(_write_path or resolve_db_path(), read_only=read_only)
     return conn
 
+def _remove_snapshot(path):
+    for p in (path, path + ".wal"):
+        try:
+            os.remove(p)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # Still open elsewhere (Windows); the next cleanup retries
+            logger.warning(f"Could not remove old snapshot {p}: {e}")
+
+def cleanup_snapshots(path=DB_PATH, keep=SNAPSHOT_RETENTION):
+    """
+    Deletes all but the newest `keep` versioned snapshots.
+    """
+    stem, ext = os.path.splitext(path)
+    current = os.path.abspath(resolve_db_path(path))
+    versions = sorted(glob.glob(f"{glob.escape(stem)}.*{ext}"))
+    for old in versions[:-keep]:
+        if os.path.abspath(old) != current:
+            logger.info(f"Removing old snapshot {old}")
+            _remove_snapshot(old)
+
+@contextmanager
+def publish_snapshot(path=DB_PATH):
+    """
+    Runs an ingest session against a private copy of the current snapshot
+    and publishes it when the block exits cleanly.
+
+    Every get_db_connection() inside the block writes to the copy, so the
+    API keeps reading the published file at full speed and never contends
+    for DuckDB's writer lock. Publishing checkpoints the copy and swaps the
+    pointer file by rename, which readers pick up on their next cursor
+    (see ReadPool). If the block raises, the copy is discarded. Nested
+    sessions share the outer one.
+    """
+    global _write_path
+    if _write_path is not None:
+        yield _write_path
+        return
+
+    base = resolve_db_path(path)
+    stem, ext = os.path.splitext(path)
+    staging = f"{stem}.{datetime.now().strftime('%Y%m%dT%H%M%S%f')}{ext}"
+    if os.path.exists(base):
+        logger.info(f"Copying {base} to {staging} for ingest...")
+        shutil.copyfile(base, staging)
+        if os.path.exists(base + ".wal"):
+            shutil.copyfile(base + ".wal", staging + ".wal")
+
+    _write_path = staging
+    try:
+        yield staging
+        conn = duckdb.connect(staging)
+        try:
+            conn.execute("CHECKPOINT")
+        finally:
+            conn.close()
+        # Refuse to overwrite a snapshot published by a concurrent session,
+        # whose changes this copy doesn't contain
+        if resolve_db_path(path) != base:
+            raise RuntimeError(f"{base} was superseded while ingesting, not publishing {staging}")
+        tmp = pointer_path(path) + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(os.path.basename(staging))
+        os.replace(tmp, pointer_path(path))
+        logger.info(f"Published snapshot {staging}")
+    except BaseException:
+        _remove_snapshot(staging)
+        raise
+    finally:
+        _write_path = None
+    cleanup_snapshots(path)
+
+class ReadPool:
+    """
+    One warm, read-only DuckDB database instance per worker process.
+
+    Opening a DuckDB file loads the catalog and starts with a cold buffer
+    pool, so doing it per request is expensive. Instead we keep a single
+    read-only connection open and hand out cursors on it. A cursor is a
+    separate connection to the same database instance: it shares the
+    catalog and buffer pool but is safe to use from its own thread.
+
+    When ingest publishes a new snapshot (the pointer file is replaced,
+    see publish_snapshot) or the database file itself is replaced on disk,
+    the next cursor request transparently reopens it. Cursors handed out
+    before the swap keep the old instance alive until they are closed.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._file_id = None
+        self._snapshot = None
+        self._opened_at = None
+        self._reopens = 0
+        self._active = 0
+        self._served = 0
+        self._last_error = None
+
+    def _file_identity(self):
+        # Publishing renames a new pointer file into place, so its inode
+        # changes with every snapshot
+        pointer = pointer_path(self.path)
+        st = os.stat(pointer if os.path.exists(pointer) else self.path)
+        return (st.st_dev, st.st_ino)
+
+    def _open(self, file_id):
+        # Attach into a private in-memory instance rather than connecting to
+        # the path directly: duckdb.connect() reuses a live instance for the
+        # same path, which would keep serving the replaced file.
+        snapshot = resolve_db_path(self.path)
+        conn = duckdb.connect(":memory:")
+        conn.execute(f"ATTACH '{snapshot}' AS {WAREHOUSE_ALIAS} (READ_ONLY)")
+        if self._conn is not None:
+            # Don't close the old handle: in-flight cursors still reference
+            # it and DuckDB releases the instance when the last one goes.
+            self._reopens += 1
+            logger.info(f"Database {snapshot} published, reopened read pool.")
+        self._conn = conn
+        self._file_id = file_id
+        self._snapshot = snapshot
+        self._opened_at = datetime.now()
+        self._last_error = None
+
+    def _current(self):
+        try:
+            file_id = self._file_identity()
+        except OSError as e:
+            self._last_error = str(e)
+            raise
+        with self._lock:
+            if self._conn is None or file_id != self._file_id:
+                try:
+                    self._open(file_id)
+                except Exception as e:
+                    self._last_error = str(e)
+                    raise
+            return self._conn
+
+    def _raw_cursor(self):
+        cursor = self._current().cursor()
+        cursor.execute(f"USE {WAREHOUSE_ALIAS}")
+        return cursor
+
+    def cursor(self):
+        """
+        Returns a new cursor on the shared database instance.
+        The caller must close it (or use `connection()`). With slow-query
+        capture enabled the cursor reports slow statements to
+        `slow_query_log` (see api/profiling.py).
+        """
+        cursor = self._raw_cursor()
+        with self._lock:
+            self._active += 1
+            self._served += 1
+        if slow_query_log.enabled:
+            return ProfiledCursor(cursor, slow_query_log, self._raw_cursor)
+        return cursor
+
+    def release(self, cursor):
+        try:
+            cursor.close()
+        finally:
+            with self._lock:
+                self._active -= 1
+
+    @contextmanager
+    def connection(self):
+        cursor = self.cursor()
+        try:
+            yield cursor
+        finally:
+            self.release(cursor)
+
+    def reopen(self):
+        """
+        Forces the next cursor request to reopen the database file.
+        """
+        with self._lock:
+            self._conn = None
+            self._file_id = None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+            self._file_id = None
+
+    def health(self):
+        with self._lock:
+            return {
+                "path": self.path,
+                "snapshot": self._snapshot,
+                "open": self._conn is not None,
+                "opened_at": self._opened_at,
+                "reopens": self._reopens,
+                "cursors_active": self._active,
+                "cursors_served": self._served,
+                "last_error": self._last_error,
+            }
+
+# Per-process read pool used by the API
+read_pool = ReadPool()
+
+def get_cursor():
+    """
+    FastAPI dependency yielding a per-request read cursor from the pool.
+    """
+    cursor = read_pool.cursor()
+    try:
+        yield cursor
+    finally:
+        read_pool.release(cursor)
+
+def bump_generation(conn, source):
+    """
+    Records that `source` finished loading new data.
+    Readers compare generations to decide when derived state is stale.
+    """
+    conn.execute("""
+        INSERT INTO meta_source_generation (source, generation, updated_at)
+        VALUES (?, 1, ?)
+        ON CONFLICT (source) DO UPDATE SET
+            generation = meta_source_generation.generation + 1,
+            updated_at = EXCLUDED.updated_at
+    """, [source, datetime.now()])
+
+def get_generations(conn):
+    """
+    Returns {source: generation} for every source that has been ingested.
+    """
+    try:
+        rows = conn.execute("SELECT source, generation FROM meta_source_generation").fetchall()
+    except duckdb.CatalogException:
+        # Database created before generation tracking existed
+        return {}
+    return {r[0]: r[1] for r in rows}
+
 def init_db():
     """
     Idempotent initialization of the database schema.
     """
-    print(f"Initializing database at {DB_PATH}...")
+    print(f"Initializing database at {_write_path or resolve_db_path()}...")
     conn = get_db_connection()
     
     # Read schema file
@@ -0,0 +1,106 @@
+import logging
+from abc import ABC, abstractmethod
+import threading
+import time
+from datetime import datetime
+from api.db import read_pool, get_generations
+from api.metrics import observe_query
+
+logger = logging.getLogger(__name__)
+
+# How often background refreshers check for a finished ingest
+REFRESH_INTERVAL_SECONDS = 15
+
+class DerivedState(ABC):
+    """
+    Base for in-memory structures derived from the warehouse.
+
+    Subclasses declare the ingest `sources` they read and implement
+    `load(conn)` returning the new state. When any of those sources
+    reports a new generation the state is rebuilt off to the side and
+    swapped in with a single reference assignment, so readers never see
+    a partial build.
+    """
+
+    name = "derived"
+    sources = ()
+
+    def __init__(self):
+        self._state = None
+        self._generations = None
+        self._built_at = None
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self._generations is not None
+
+    @abstractmethod
+    def load(self, conn):
+        """
+        Builds the state from `conn`; it replaces the previous one whole.
+        """
+
+    def _source_generations(self, conn):
+        generations = get_generations(conn)
+        return tuple(generations.get(s, 0) for s in self.sources)
+
+    def build(self, conn, generations=None):
+        if generations is None:
+            generations = self._source_generations(conn)
+        start = time.perf_counter()
+        state = self.load(conn)
+        observe_query(f"{self.name}.load", time.perf_counter() - start)
+        self._state = state
+        self._generations = generations
+        self._built_at = datetime.now()
+
+    def refresh(self):
+        """
+        Rebuilds the state if one of its sources has been re-ingested
+        since the last build. Returns True when a rebuild happened.
+        """
+        with self._build_lock:
+            with read_pool.connection() as conn:
+                generations = self._source_generations(conn)
+                if generations == self._generations:
+                    return False
+                self.build(conn, generations)
+                return True
+
+    def ensure_ready(self):
+        if not self.ready:
+            self.refresh()
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "built_at": self._built_at,
+            "generations": dict(zip(self.sources, self._generations or ())),
+        }
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"{self.name} refresh failed: {e}")
+            self._stop.wait(interval)
+
+    def start(self, interval=REFRESH_INTERVAL_SECONDS):
+        """
+        Starts the background thread that watches for finished ingests.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._thread = None
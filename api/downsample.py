@@ -0,0 +1,143 @@
+import numpy as np
+
+# `resolution` values accepted by the history endpoints
+RESOLUTION_PATTERN = "^(raw|auto|hour|day|week|month|lttb)$"
+
+# Cap on points returned to charts unless the caller asks for fewer
+DEFAULT_MAX_POINTS = 1000
+
+# Candidate buckets for resolution=auto, finest first
+BUCKET_SECONDS = {
+    "hour": 3600,
+    "day": 86400,
+    "week": 7 * 86400,
+    "month": 2629746,
+}
+
+def choose_bucket(start, end, max_points):
+    """
+    Finest bucket that keeps the [start, end] span within max_points.
+    """
+    span = (end - start).total_seconds()
+    for name, seconds in BUCKET_SECONDS.items():
+        if span / seconds <= max_points:
+            return name
+    return "month"
+
+def bucket_sql(sql, bucket, time_col, value_cols, group_cols=()):
+    """
+    Wraps `sql`, averaging `value_cols` per date_trunc(bucket, time_col)
+    and `group_cols`. Output keeps the input column names.
+    """
+    groups = "".join(f", {c}" for c in group_cols)
+    averages = ", ".join(f"AVG({c}) as {c}" for c in value_cols)
+    return f"""
+        SELECT date_trunc('{bucket}', {time_col}) as {time_col}{groups}, {averages}
+        FROM ({sql}) src
+        GROUP BY ALL
+        ORDER BY {time_col}
+    """
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: indices of `threshold` points that
+    best preserve the visual shape of (x, y). `x` must be sorted.
+    The outer loop is over output buckets; each bucket is scored with
+    vectorized NumPy.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # Interior points split into threshold - 2 buckets; ends are always kept
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third vertex
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+def downsample_columns(columns, time_col, value_col, max_points, group_col=None):
+    """
+    Applies LTTB to a dict of NumPy columns (as returned by fetchnumpy())
+    when it holds more than `max_points` rows. With `group_col`, each group
+    is reduced separately and gets an equal share of the budget.
+    """
+    n = len(columns[time_col])
+    if n <= max_points:
+        return columns
+
+    if group_col is None:
+        groups = [np.arange(n)]
+    else:
+        keys = np.asarray(columns[group_col])
+        groups = [np.flatnonzero(keys == k) for k in np.unique(keys)]
+
+    per_group = max(3, max_points // len(groups))
+    keep = []
+    for rows in groups:
+        x = np.asarray(columns[time_col][rows]).astype("datetime64[us]").astype(np.int64)
+        y = np.asarray(columns[value_col][rows], dtype=np.float64)
+        keep.append(rows[lttb_indices(x, y, per_group)])
+    keep = np.sort(np.concatenate(keep))
+
+    return {name: np.asarray(values)[keep] for name, values in columns.items()}
+
+def fetch_series(conn, sql, params, time_col, value_cols, resolution, max_points, group_cols=(), descending=False):
+    """
+    Runs a time-series query with the requested resolution and returns
+    NumPy columns with at most `max_points` rows (per group).
+
+    hour/day/week/month bucket in SQL; auto picks the finest bucket that
+    fits the range; lttb (and any result still over budget) is reduced
+    with Largest-Triangle-Three-Buckets on the first value column.
+    Rows come back oldest first unless `descending` is set.
+    """
+    if resolution == "auto":
+        start, end = conn.execute(f"SELECT MIN({time_col}), MAX({time_col}) FROM ({sql}) src", params).fetchone()
+        resolution = choose_bucket(start, end, max_points) if start is not None else "raw"
+
+    if resolution in BUCKET_SECONDS:
+        sql = bucket_sql(sql, resolution, time_col, value_cols, group_cols)
+    else:
+        sql = f"SELECT * FROM ({sql}) src ORDER BY {time_col}"
+
+    columns = conn.execute(sql, params).fetchnumpy()
+    group_col = group_cols[0] if group_cols else None
+    columns = downsample_columns(columns, time_col, value_cols[0], max_points, group_col)
+    if descending:
+        columns = {name: np.asarray(values)[::-1] for name, values in columns.items()}
+    return columns
+
+def columns_to_records(columns):
+    """
+    Converts NumPy columns to a list of row dicts for JSON responses.
+    """
+    names = list(columns)
+    values = []
+    for name in names:
+        column = columns[name]
+        if np.issubdtype(column.dtype, np.datetime64):
+            column = column.astype("datetime64[us]")
+        values.append(column.tolist())
+    return [dict(zip(names, row)) for row in zip(*values)]
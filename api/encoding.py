@@ -0,0 +1,73 @@
+import os
+from decimal import Decimal
+import orjson
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter
+
+# Debug aid: validate JSON responses against their Pydantic models before
+# sending. Off by default, since it costs a model object per row.
+VALIDATE_RESPONSES = os.getenv("STABLETRACE_VALIDATE_RESPONSES", "").lower() in ("1", "true", "yes")
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def encode_json(data):
+    """
+    Encodes plain Python/NumPy data to JSON bytes in one orjson call.
+    Datetimes come out in ISO 8601 like FastAPI's encoder; NaN becomes null.
+    """
+    return orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+
+class ORJSONResponse(JSONResponse):
+    """
+    Default response class. Only used for what handlers return as plain
+    data; large responses should be returned via json_response() so
+    FastAPI's per-object encoder is skipped as well.
+    """
+
+    def render(self, content):
+        return encode_json(content)
+
+_adapters = {}
+
+def validate(model, data):
+    """
+    Checks `data` against `model` when STABLETRACE_VALIDATE_RESPONSES is set.
+    """
+    if VALIDATE_RESPONSES and model is not None:
+        adapter = _adapters.get(model)
+        if adapter is None:
+            adapter = _adapters.setdefault(model, TypeAdapter(model))
+        adapter.validate_python(data)
+    return data
+
+def json_response(data, model=None, headers=None):
+    """
+    Encodes `data` directly, bypassing response_model validation (routes
+    keep response_model for the OpenAPI schema). `model` is only checked
+    in validation mode.
+    """
+    validate(model, data)
+    return Response(content=encode_json(data), media_type="application/json", headers=headers)
+
+def _arrow_table(conn):
+    # to_arrow_table() replaced fetch_arrow_table() in DuckDB 1.4
+    if hasattr(conn, "to_arrow_table"):
+        return conn.to_arrow_table()
+    return conn.fetch_arrow_table()
+
+def fetch_records(conn, sql, params=None):
+    """
+    Runs `sql` and returns its rows as dicts, converted from an Arrow table
+    column by column rather than row by row from tuples. Nested LIST/STRUCT
+    columns come back as lists and dicts.
+    """
+    conn.execute(sql, params or [])
+    return _arrow_table(conn).to_pylist()
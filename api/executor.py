@@ -0,0 +1,300 @@
+import asyncio
+import logging
+import threading
+import time
+import duckdb
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from api.db import read_pool
+from api.metrics import observe_query, count_rows
+
+logger = logging.getLogger(__name__)
+
+# How often a waiting request checks whether its client went away
+DISCONNECT_POLL_SECONDS = 0.1
+
+class QueryLane:
+    """
+    A dedicated, bounded thread pool for one class of queries.
+
+    Lanes keep heavy scans from occupying the threads cheap queries need:
+    each lane has its own workers, and requests wait at most `timeout`
+    seconds for admission plus execution.
+    """
+
+    def __init__(self, name, workers, timeout):
+        self.name = name
+        self.workers = workers
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"duckdb-{name}")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+LANES = {
+    # Small aggregates and lookups (filters, stats, supply rollups)
+    "light": QueryLane("light", workers=4, timeout=5),
+    # Joins and scans over the sanctions tables
+    "heavy": QueryLane("heavy", workers=2, timeout=30),
+}
+
+# Per-route concurrency caps, checked before a query enters its lane.
+# Routes not listed may use every worker of their lane.
+ROUTE_CONCURRENCY = {
+    "/risk/sanctions/latest": 2,
+    # Streams hold their slot for the whole download
+    "/export/supply": 2,
+    "/export/sanctions": 2,
+}
+
+_route_semaphores = {}
+
+def _route_semaphore(route, lane):
+    semaphore = _route_semaphores.get(route)
+    if semaphore is None:
+        limit = ROUTE_CONCURRENCY.get(route, lane.workers)
+        semaphore = _route_semaphores.setdefault(route, asyncio.Semaphore(limit))
+    return semaphore
+
+def _route_name(request):
+    route = request.scope.get("route")
+    return getattr(route, "path", request.url.path)
+
+def _query_name(request, fn):
+    # Named helpers report under their own name, inline lambdas under the route
+    name = getattr(fn, "__name__", "<lambda>")
+    return _route_name(request) if name == "<lambda>" else name
+
+class QueryHandle:
+    """
+    The cursor of one in-flight query, shared between the lane worker
+    that opens it and the event loop, which may interrupt it at any time
+    (including before the worker got a cursor).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cursor = None
+        self.interrupted = False
+
+    def open(self):
+        # Getting a cursor may reopen the database after a snapshot
+        # publish, so this runs on the lane worker, never the event loop
+        cursor = read_pool.cursor()
+        with self._lock:
+            if not self.interrupted:
+                self._cursor = cursor
+                return cursor
+        read_pool.release(cursor)
+        raise duckdb.InterruptException("Query interrupted before it started")
+
+    def release(self):
+        with self._lock:
+            cursor, self._cursor = self._cursor, None
+        if cursor is not None:
+            read_pool.release(cursor)
+
+    def interrupt(self):
+        with self._lock:
+            self.interrupted = True
+            if self._cursor is not None:
+                self._cursor.interrupt()
+
+def _execute(handle, fn, args, name):
+    start = time.perf_counter()
+    try:
+        result = fn(handle.open(), *args)
+    finally:
+        handle.release()
+    observe_query(name, time.perf_counter() - start, count_rows(result))
+    return result
+
+async def _wait_for_disconnect(request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+async def _admit(request, query_lane):
+    """
+    Takes a slot of the route's semaphore, or raises a 503 if none frees
+    up within the lane timeout. The caller releases it.
+    """
+    semaphore = _route_semaphore(_route_name(request), query_lane)
+    try:
+        await asyncio.wait_for(semaphore.acquire(), timeout=query_lane.timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Too many concurrent queries, retry shortly")
+    return semaphore
+
+async def _await_query(request, handle, future, deadline):
+    """
+    Waits for a lane future until `deadline`, interrupting the query if
+    that passes (504) or the client disconnects first (499).
+    """
+    loop = asyncio.get_running_loop()
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait(
+            {future, watcher},
+            timeout=max(0.0, deadline - loop.time()),
+            return_when=asyncio.FIRST_COMPLETED
+        )
+    finally:
+        watcher.cancel()
+
+    if future in done:
+        return future.result()
+
+    # Timed out or the client left: stop DuckDB and wait for the worker
+    # to unwind so the slot and cursor are released.
+    handle.interrupt()
+    try:
+        await future
+    except Exception:
+        pass
+
+    if watcher in done:
+        logger.info(f"Client disconnected, interrupted query on {request.url.path}")
+        raise HTTPException(status_code=499, detail="Client closed request")
+    raise HTTPException(status_code=504, detail="Query timed out")
+
+async def run_query(request, fn, *args, lane="light", name=None):
+    """
+    Runs `fn(cursor, *args)` on a pooled cursor in the given lane without
+    blocking the event loop.
+
+    The query is interrupted (DuckDB `interrupt()`) if the client
+    disconnects or the lane timeout expires; the latter returns a 504.
+    Requests that can't get a slot before the timeout get a 503.
+    Execution time and rows are recorded under `name` (default: the
+    function's name, or the route for lambdas).
+    """
+    query_lane = LANES[lane]
+    name = name or _query_name(request, fn)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + query_lane.timeout
+
+    semaphore = await _admit(request, query_lane)
+    try:
+        handle = QueryHandle()
+        future = loop.run_in_executor(query_lane.executor, _execute, handle, fn, args, name)
+        return await _await_query(request, handle, future, deadline)
+    finally:
+        semaphore.release()
+
+# Returned by QueryStream workers once the chunk generator is exhausted
+_END = object()
+
+class QueryStream:
+    """
+    Async iterator over the chunks of a generator running against a
+    pooled cursor, for StreamingResponse (see open_stream).
+
+    Each chunk is produced on the lane's workers within the lane timeout.
+    The stream holds its route slot and cursor until close(), which
+    interrupts the query if it is still running and releases both.
+    """
+
+    def __init__(self, query_lane, semaphore, handle, chunks, first):
+        self._lane = query_lane
+        self._semaphore = semaphore
+        self._handle = handle
+        self._chunks = chunks
+        self._first = first
+        # Serializes next() and close() on the generator, which may run
+        # on different lane workers
+        self._lock = threading.Lock()
+        self._done = first is _END
+        self._closed = False
+
+    def _next(self):
+        with self._lock:
+            try:
+                chunk = next(self._chunks, _END)
+            except BaseException:
+                self._done = True
+                raise
+            self._done = chunk is _END
+            return chunk
+
+    async def __aiter__(self):
+        if self._first is _END:
+            return
+        yield self._first
+        loop = asyncio.get_running_loop()
+        while True:
+            future = loop.run_in_executor(self._lane.executor, self._next)
+            try:
+                chunk = await asyncio.wait_for(future, timeout=self._lane.timeout)
+            except asyncio.TimeoutError:
+                # Headers are already sent, so the response is cut short
+                logger.warning(f"Stream chunk took over {self._lane.timeout}s, aborting the response")
+                raise
+            if chunk is _END:
+                return
+            yield chunk
+
+    def _finish(self, loop):
+        try:
+            with self._lock:
+                self._chunks.close()
+        except Exception as e:
+            logger.warning(f"Error closing query stream: {e}")
+        finally:
+            self._handle.release()
+            loop.call_soon_threadsafe(self._semaphore.release)
+
+    def close(self):
+        """
+        Releases the stream's cursor and slot; safe to call more than once.
+        Must be called on the event loop and never blocks it: the
+        generator is closed on a lane worker once any chunk still being
+        produced has been interrupted.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if not self._done:
+            self._handle.interrupt()
+        loop = asyncio.get_running_loop()
+        try:
+            self._lane.executor.submit(self._finish, loop)
+        except RuntimeError:
+            # Lanes already shut down
+            self._finish(loop)
+
+def _start_stream(handle, produce, args):
+    chunks = produce(handle.open(), *args)
+    try:
+        return chunks, next(chunks, _END)
+    except BaseException:
+        chunks.close()
+        handle.release()
+        raise
+
+async def open_stream(request, produce, *args, lane="heavy"):
+    """
+    Streaming counterpart of run_query: admits the request to the route's
+    slots in `lane`, opens a cursor on a lane worker and runs
+    `produce(cursor, *args)` (a generator of bytes) up to its first chunk,
+    so errors, timeouts (504), disconnects (499) and a full lane (503)
+    are reported before the response starts. The returned QueryStream
+    must be closed (see api.streaming.QueryStreamingResponse).
+    """
+    query_lane = LANES[lane]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + query_lane.timeout
+
+    semaphore = await _admit(request, query_lane)
+    handle = QueryHandle()
+    try:
+        future = loop.run_in_executor(query_lane.executor, _start_stream, handle, produce, args)
+        chunks, first = await _await_query(request, handle, future, deadline)
+    except BaseException:
+        handle.release()
+        semaphore.release()
+        raise
+    return QueryStream(query_lane, semaphore, handle, chunks, first)
+
+def shutdown_lanes():
+    for lane in LANES.values():
+        lane.shutdown()
@@ -1,14 +1,45 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import duckdb
-from api.db import get_db_connection
+from api.db import read_pool
+from api.cache import cached_response, response_cache
+from api.executor import run_query, shutdown_lanes
+from api.encoding import ORJSONResponse, json_response, fetch_records
+from api.metrics import MetricsMiddleware, ServiceCollector, render_metrics
+from prometheus_client import REGISTRY, CONTENT_TYPE_LATEST
+from api.streaming import arrow_response, table_response, FORMAT_PATTERN
+from api.downsample import fetch_series, columns_to_records, RESOLUTION_PATTERN, DEFAULT_MAX_POINTS
+from api.screening import screening_index
+from api.series import series_store
 from api.models.responses import GlobalSupplyPoint, AssetSupplyResponse, SupplyPoint
 from typing import List
-from api.routers import risk
+from api.profiling import slow_query_log
+from api.routers import risk, export, debug
 
-app = FastAPI(title="StableTrace API", version="0.1.0")
+# Ingest sources behind the supply and price routes (see meta_source_generation)
+SUPPLY_SOURCES = ("defillama",)
+PRICE_SOURCES = ("defillama", "coingecko")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    screening_index.start()
+    series_store.start()
+    yield
+    screening_index.stop()
+    series_store.stop()
+    shutdown_lanes()
+    slow_query_log.shutdown()
+    read_pool.close()
+
+app = FastAPI(title="StableTrace API", version="0.1.0", lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.include_router(risk.router)
+app.include_router(export.router)
+app.include_router(debug.router)
+
+app.add_middleware(MetricsMiddleware)
+REGISTRY.register(ServiceCollector(read_pool, response_cache, (screening_index, series_store)))
 
 # Allow CORS for Next.js local dev
 app.add_middleware(
@@ -20,75 +51,163 @@ app.add_middleware(
 )
 
 @app.get("/health")
-def health_check():
-    return {"status": "ok", "service": "stabletrace-api"}
+async def health_check():
+    return {
+        "status": "ok",
+        "service": "stabletrace-api",
+        "database": read_pool.health(),
+        "screening_index": screening_index.stats(),
+        "series_store": series_store.stats(),
+        "response_cache": response_cache.stats()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/")
 def root():
     return {
         "message": "Welcome to StableTrace API",
         "docs": "/docs",
-        "endpoints": ["/health", "/supply/global", "/supply/assets"]
+        "endpoints": ["/health", "/metrics", "/supply/global", "/supply/assets", "/supply/assets/{asset_id}", "/prices/history", "/export/supply"]
     }
 
+# Daily totals are maintained by ingest (see ingest/rollups.py)
+# Note: This is an approximation if we have mixed sources.
+# Assuming source='defillama' is the main one.
+GLOBAL_SUPPLY_SQL = """
+    SELECT day as timestamp, total_supply
+    FROM agg_supply_daily
+    ORDER BY day DESC
+    LIMIT ?
+"""
+
 @app.get("/supply/global", response_model=List[GlobalSupplyPoint])
-def get_global_supply(days: int = 30):
+async def get_global_supply(
+    request: Request,
+    days: int = 30,
+    resolution: str = Query("raw", pattern=RESOLUTION_PATTERN),
+    max_points: int = Query(DEFAULT_MAX_POINTS, ge=3),
+    format: str = Query("json", pattern=FORMAT_PATTERN)
+):
     """
     Returns total stablecoin supply over time.
+    `resolution` buckets the series (hour/day/week/month, or auto to fit
+    `max_points`) or reduces it with LTTB; JSON responses never exceed
+    `max_points`. `format=arrow|parquet` returns Arrow IPC / Parquet;
+    raw binary output is streamed without the point cap.
     """
-    conn = get_db_connection(read_only=True)
-    try:
-        # Aggregate supply by day
-        # Note: This is an approximation if we have mixed sources.
-        # Assuming source='defillama' is the main one.
-        query = """
-            SELECT 
-                date_trunc('day', timestamp) as day, 
-                SUM(supply) as total_supply 
-            FROM fact_supply 
-            WHERE source = 'defillama'
-            GROUP BY day
-            ORDER BY day DESC
-            LIMIT ?
-        """
-        # DuckDB requires a list for parameters
-        rows = conn.execute(query, [days]).fetchall()
-        
-        results = []
-        for r in rows:
-            results.append(GlobalSupplyPoint(
-                timestamp=r[0],
-                total_supply=r[1]
-            ))
-        return results
-    finally:
-        conn.close()
+    if format != "json":
+        if resolution == "raw":
+            return await arrow_response(
+                request, GLOBAL_SUPPLY_SQL, [days], format, "global_supply",
+                name="stream_global_supply", lane="light"
+            )
+        columns = await run_query(request, query_global_supply, days, resolution, max_points)
+        return table_response(columns, format, "global_supply")
+
+    return await cached_response(
+        request, SUPPLY_SOURCES,
+        lambda conn: columns_to_records(query_global_supply(conn, days, resolution, max_points)),
+        name="query_global_supply", model=List[GlobalSupplyPoint]
+    )
+
+def query_global_supply(conn, days, resolution, max_points):
+    return fetch_series(
+        conn, GLOBAL_SUPPLY_SQL, [days], "timestamp", ["total_supply"],
+        resolution, max_points, descending=True
+    )
 
 @app.get("/supply/assets")
-def get_top_assets(limit: int = 10):
-    conn = get_db_connection(read_only=True)
-    try:
-        # Get latest supply for each asset
-        query = """
-            WITH latest AS (
-                SELECT 
-                    asset_id, 
-                    supply, 
-                    ROW_NUMBER() OVER (PARTITION BY asset_id ORDER BY timestamp DESC) as rn
-                FROM fact_supply
-                WHERE source = 'defillama'
-            )
-            SELECT 
-                d.symbol, 
-                d.name, 
-                l.supply
-            FROM latest l
-            JOIN dim_assets d ON l.asset_id = d.asset_id
-            WHERE l.rn = 1
-            ORDER BY l.supply DESC
-            LIMIT ?
-        """
-        rows = conn.execute(query, [limit]).fetchall()
-        return [{"symbol": r[0], "name": r[1], "supply": r[2]} for r in rows]
-    finally:
-        conn.close()
+async def get_top_assets(request: Request, limit: int = 10):
+    """
+    Returns the largest assets by current supply.
+    """
+    return await cached_response(request, SUPPLY_SOURCES, lambda conn: query_top_assets(conn, limit), name="query_top_assets")
+
+def query_top_assets(conn, limit):
+    # current_supply is upserted by ingest and ranked per chain
+    # (see ingest/rollups.py), so this reads `limit` rows instead of
+    # windowing the whole supply history.
+    query = """
+        SELECT 
+            d.symbol, 
+            d.name, 
+            c.supply,
+            c.prev_supply,
+            c.supply - c.prev_supply as change,
+            c.timestamp as as_of
+        FROM current_supply c
+        JOIN dim_assets d ON c.asset_id = d.asset_id
+        WHERE c.chain = 'Total' AND c.supply_rank BETWEEN 1 AND ?
+        ORDER BY c.supply_rank
+    """
+    return fetch_records(conn, query, [limit])
+
+@app.get("/supply/assets/{asset_id}", response_model=AssetSupplyResponse)
+def get_asset_supply(
+    asset_id: str,
+    chain: str = None,
+    days: int = 30,
+    max_points: int = Query(DEFAULT_MAX_POINTS, ge=3)
+):
+    """
+    Returns the current supply of one asset and its supply history per
+    chain over the last `days` days, each chain capped at `max_points`.
+    Served from the in-memory series store (see api/series.py).
+    """
+    series_store.ensure_ready()
+    result = series_store.asset(asset_id, days=days, chain=chain, max_points=max_points)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Unknown asset {asset_id}")
+    return json_response(result, AssetSupplyResponse)
+
+@app.get("/prices/history")
+async def get_price_history(
+    request: Request,
+    asset_id: str,
+    source: str = None,
+    days: int = 30,
+    resolution: str = Query("raw", pattern=RESOLUTION_PATTERN),
+    max_points: int = Query(DEFAULT_MAX_POINTS, ge=3),
+    format: str = Query("json", pattern=FORMAT_PATTERN)
+):
+    """
+    Returns the price history of one asset over the last `days` days.
+    `resolution` and `max_points` downsample each source's series as in
+    /supply/global. `format=arrow|parquet` returns Arrow IPC / Parquet;
+    raw binary output is streamed without the point cap.
+    """
+    where_parts = ["asset_id = ?", "timestamp >= now() - to_days(CAST(? AS INTEGER))"]
+    params = [asset_id, days]
+    if source:
+        where_parts.append("source = ?")
+        params.append(source)
+
+    query = f"""
+        SELECT timestamp, asset_id, price_usd, source
+        FROM fact_prices
+        WHERE {" AND ".join(where_parts)}
+        ORDER BY timestamp
+    """
+    if format != "json" and resolution == "raw":
+        return await arrow_response(
+            request, query, params, format, f"prices_{asset_id}",
+            name="stream_price_history", lane="light"
+        )
+
+    def query_price_history(conn):
+        # Sources are downsampled separately so their series don't interleave
+        return fetch_series(
+            conn, query, params, "timestamp", ["price_usd"],
+            resolution, max_points, group_cols=("source", "asset_id")
+        )
+
+    if format != "json":
+        columns = await run_query(request, query_price_history)
+        return table_response(columns, format, f"prices_{asset_id}")
+
+    return await cached_response(request, PRICE_SOURCES, lambda conn: columns_to_records(query_price_history(conn)),
+        name="query_price_history"
+    )
@@ -0,0 +1,122 @@
+import os
+import time
+from prometheus_client import Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from api.db import DB_PATH
+
+# Textfile the ingest process writes its metrics to (see ingest/metrics.py).
+# Ingest runs as a separate process, so the API appends it to /metrics.
+INGEST_METRICS_PATH = os.path.splitext(DB_PATH)[0] + ".ingest.prom"
+
+# Spans cheap cached lookups up to the heavy lane's 30s timeout
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUEST_LATENCY = Histogram(
+    "stabletrace_http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+QUERY_LATENCY = Histogram(
+    "stabletrace_query_duration_seconds",
+    "DuckDB execution time by named query.",
+    ["query"],
+    buckets=LATENCY_BUCKETS,
+)
+QUERY_ROWS = Counter(
+    "stabletrace_query_rows",
+    "Rows returned by named query.",
+    ["query"],
+)
+
+def count_rows(result):
+    """
+    Best-effort row count of a query helper's return value: a list of
+    records, a page dict with `items`, or a dict of NumPy columns.
+    """
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, dict):
+        if isinstance(result.get("items"), list):
+            return len(result["items"])
+        first = next(iter(result.values()), None)
+        if hasattr(first, "__len__") and not isinstance(first, str):
+            return len(first)
+    return None
+
+def observe_query(name, seconds, rows=None):
+    QUERY_LATENCY.labels(name).observe(seconds)
+    if rows is not None:
+        QUERY_ROWS.labels(name).inc(rows)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request latency per route template (not
+    the raw path, to keep label cardinality bounded). Streaming responses
+    are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched route on the shared scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_LATENCY.labels(route, scope["method"], str(status)).observe(time.perf_counter() - start)
+
+class ServiceCollector:
+    """
+    Reports read pool, response cache and derived-state stats at scrape
+    time. Process RSS and CPU come from prometheus_client's default
+    process collector.
+    """
+
+    def __init__(self, pool, cache, derived=()):
+        self.pool = pool
+        self.cache = cache
+        self.derived = derived
+
+    def collect(self):
+        health = self.pool.health()
+        yield GaugeMetricFamily("stabletrace_pool_open", "Whether the read pool has the database open.", value=int(health["open"]))
+        yield GaugeMetricFamily("stabletrace_pool_cursors_active", "Read cursors currently checked out.", value=health["cursors_active"])
+        yield CounterMetricFamily("stabletrace_pool_cursors_served", "Read cursors handed out since start.", value=health["cursors_served"])
+        yield CounterMetricFamily("stabletrace_pool_reopens", "Times the read pool reopened a replaced database file.", value=health["reopens"])
+
+        stats = self.cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        yield GaugeMetricFamily("stabletrace_cache_entries", "Responses held in the response cache.", value=stats["entries"])
+        yield CounterMetricFamily("stabletrace_cache_hits", "Response cache hits.", value=stats["hits"])
+        yield CounterMetricFamily("stabletrace_cache_misses", "Response cache misses.", value=stats["misses"])
+        yield GaugeMetricFamily("stabletrace_cache_hit_ratio", "Response cache hits over lookups since start.", value=stats["hits"] / lookups if lookups else 0.0)
+
+        ready = GaugeMetricFamily("stabletrace_derived_ready", "Whether an in-memory derived structure has been built.", labels=["name"])
+        for state in self.derived:
+            ready.add_metric([state.name], int(state.ready))
+        yield ready
+
+def render_metrics(path=INGEST_METRICS_PATH):
+    """
+    Prometheus exposition for this process plus the last ingest run.
+    """
+    output = generate_latest(REGISTRY)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            output += f.read()
+    return output
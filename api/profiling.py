@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: statements slower than this many milliseconds are profiled.
+# Unset (the default) disables the hook entirely.
+SLOW_QUERY_MS = os.getenv("STABLETRACE_SLOW_QUERY_MS")
+
+# Number of captured slow queries kept in memory
+SLOW_QUERY_BUFFER = int(os.getenv("STABLETRACE_SLOW_QUERY_BUFFER", "100"))
+
+def _operators(node, depth=0):
+    """
+    Flattens a DuckDB JSON profile tree into per-operator timings.
+    Key names changed in DuckDB 1.1 (`name`/`timing` -> `operator_*`).
+    """
+    operators = []
+    for child in node.get("children", []):
+        operators.append({
+            "depth": depth,
+            "operator": child.get("operator_name", child.get("name")),
+            "seconds": child.get("operator_timing", child.get("timing")),
+            "rows": child.get("operator_cardinality", child.get("cardinality")),
+        })
+        operators.extend(_operators(child, depth + 1))
+    return operators
+
+class SlowQueryLog:
+    """
+    Ring buffer of slow statements with their DuckDB profiles.
+
+    A statement that takes longer than the threshold is re-run once with
+    JSON profiling enabled on a separate cursor, in the background so the
+    slow request isn't delayed further. Only one re-run is in flight at a
+    time; slow queries arriving meanwhile are recorded without a profile.
+    """
+
+    def __init__(self, threshold_ms=SLOW_QUERY_MS, size=SLOW_QUERY_BUFFER):
+        self.threshold = float(threshold_ms) / 1000 if threshold_ms else None
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._profiling = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="duckdb-profile")
+
+    @property
+    def enabled(self):
+        return self.threshold is not None
+
+    def observe(self, cursor_factory, sql, params, seconds):
+        if seconds < self.threshold:
+            return
+        entry = {
+            "at": datetime.now(),
+            "sql": " ".join(sql.split()),
+            "params": [p if isinstance(p, (int, float, str, type(None))) else str(p) for p in params or []],
+            "seconds": seconds,
+            "profile": None,
+            "operators": None,
+        }
+        with self._lock:
+            self._entries.append(entry)
+            if self._profiling:
+                return
+            self._profiling = True
+        self._executor.submit(self._profile, cursor_factory, sql, params, entry)
+
+    def _profile(self, cursor_factory, sql, params, entry):
+        fd, path = tempfile.mkstemp(suffix=".json", prefix="duckdb-profile-")
+        os.close(fd)
+        cursor = None
+        try:
+            cursor = cursor_factory()
+            cursor.execute("PRAGMA enable_profiling='json'")
+            cursor.execute(f"PRAGMA profiling_output='{path}'")
+            cursor.execute(sql, params or [])
+            cursor.fetchall()
+            cursor.execute("PRAGMA disable_profiling")
+            with open(path) as f:
+                profile = json.load(f)
+            entry["profile"] = profile
+            entry["operators"] = _operators(profile)
+        except Exception as e:
+            logger.warning(f"Failed to profile slow query: {e}")
+            entry["profile"] = {"error": str(e)}
+        finally:
+            if cursor is not None:
+                cursor.close()
+            os.remove(path)
+            with self._lock:
+                self._profiling = False
+
+    def entries(self):
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class ProfiledCursor:
+    """
+    Wraps a pooled DuckDB cursor, timing each execute() and reporting
+    slow statements to the log. Everything else is delegated.
+    """
+
+    def __init__(self, cursor, log, cursor_factory):
+        self._cursor = cursor
+        self._log = log
+        self._cursor_factory = cursor_factory
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        result = self._cursor.execute(sql, params) if params is not None else self._cursor.execute(sql)
+        self._log.observe(self._cursor_factory, sql, params, time.perf_counter() - start)
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+# Per-process log used by the read pool
+slow_query_log = SlowQueryLog()
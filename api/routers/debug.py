@@ -0,0 +1,36 @@
+import os
+import secrets
+from fastapi import APIRouter, Depends, Header, HTTPException
+from api.profiling import slow_query_log
+
+router = APIRouter(prefix="/debug", tags=["debug"], include_in_schema=False)
+
+# Debug routes are only served when an admin token is configured
+ADMIN_TOKEN = os.getenv("STABLETRACE_ADMIN_TOKEN")
+
+def require_admin(x_admin_token: str = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@router.get("/slow-queries", dependencies=[Depends(require_admin)])
+def get_slow_queries(limit: int = 20, profile: bool = False):
+    """
+    Most recent statements over STABLETRACE_SLOW_QUERY_MS, newest first,
+    with their SQL, parameters and per-operator timings. `profile=true`
+    includes the raw DuckDB JSON profile.
+    """
+    entries = slow_query_log.entries()[:limit]
+    if not profile:
+        entries = [{k: v for k, v in e.items() if k != "profile"} for e in entries]
+    return {
+        "enabled": slow_query_log.enabled,
+        "threshold_ms": slow_query_log.threshold * 1000 if slow_query_log.enabled else None,
+        "queries": entries,
+    }
+
+@router.delete("/slow-queries", dependencies=[Depends(require_admin)])
+def clear_slow_queries():
+    slow_query_log.clear()
+    return {"cleared": True}
@@ -0,0 +1,84 @@
+from fastapi import APIRouter, Query, Request
+from datetime import datetime
+from typing import List
+from api.streaming import arrow_response, text_response, BINARY_FORMAT_PATTERN, TEXT_FORMAT_PATTERN
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+@router.get("/supply")
+async def export_supply(
+    request: Request,
+    asset_id: List[str] = Query(None),
+    chain: str = None,
+    source: str = None,
+    start: datetime = None,
+    end: datetime = None,
+    format: str = Query("parquet", pattern=BINARY_FORMAT_PATTERN)
+):
+    """
+    Bulk export of fact_supply as Parquet (default) or an Arrow IPC stream.
+    Filters: one or more asset_id, chain, source and a [start, end) time range.
+    """
+    where_parts = []
+    params = []
+
+    if asset_id:
+        where_parts.append("f.asset_id IN (SELECT unnest(?::VARCHAR[]))")
+        params.append(asset_id)
+    if chain:
+        where_parts.append("f.chain = ?")
+        params.append(chain)
+    if source:
+        where_parts.append("f.source = ?")
+        params.append(source)
+    if start:
+        where_parts.append("f.timestamp >= ?")
+        params.append(start)
+    if end:
+        where_parts.append("f.timestamp < ?")
+        params.append(end)
+
+    where_clause = ""
+    if where_parts:
+        where_clause = "WHERE " + " AND ".join(where_parts)
+
+    query = f"""
+        SELECT f.timestamp, f.asset_id, d.symbol, f.chain, f.supply, f.source
+        FROM fact_supply f
+        LEFT JOIN dim_assets d ON f.asset_id = d.asset_id
+        {where_clause}
+        ORDER BY f.asset_id, f.chain, f.timestamp
+    """
+    return await arrow_response(request, query, params, format, "supply_export", name="export_supply")
+
+@router.get("/sanctions")
+async def export_sanctions(
+    request: Request,
+    format: str = Query("ndjson", pattern=TEXT_FORMAT_PATTERN),
+    since: datetime = None,
+    gzip: bool = False
+):
+    """
+    Streams the merged sanctioned-address list (OFAC, OpenSanctions,
+    CryptoScamDB) as NDJSON (default) or CSV, one row per address.
+    `since` keeps only rows listed at or after that time for incremental
+    syncs; `gzip=true` returns a gzip-compressed file.
+    """
+    params = []
+    where_clause = ""
+    if since:
+        where_clause = "WHERE f.listed_date >= ?"
+        params.append(since)
+
+    query = f"""
+        SELECT
+            f.address, f.chain, f.entity_id, e.name as entity_name, e.authority, e.program,
+            f.source_ref, f.listed_date, f.confidence_score
+        FROM fact_sanctioned_addresses f
+        LEFT JOIN dim_sanctions_entity e ON f.entity_id = e.entity_id
+        {where_clause}
+        ORDER BY f.listed_date, f.address
+    """
+    return await text_response(
+        request, query, params, format, "sanctioned_addresses", compress=gzip, name="export_sanctions"
+    )
@@ -1,7 +1,15 @@
-from fastapi import APIRouter
-from api.db import get_db_connection
-from pydantic import BaseModel
-from typing import List, Dict
+from fastapi import APIRouter, HTTPException, Query, Request
+import base64
+import json
+from datetime import datetime
+from api.db import get_generations
+from api.cache import cached_response, ResponseCache
+from api.encoding import json_response, fetch_records
+from api.executor import run_query
+from api.screening import screening_index, SANCTIONS_SOURCES
+from api.search import search_hits_sql
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional
 
 router = APIRouter(prefix="/risk", tags=["risk"])
 
@@ -14,131 +22,301 @@ class SanctionedEntity(BaseModel):
     name: str
     program: str
     authority: str
-    addresses: List[dict] # {address, chain}
-    opencorporates_search_url: str = None
-    source_url: str = None
+    addresses: List[dict] # {address, chain, date}
+    opencorporates_search_url: Optional[str] = None
+    source_url: Optional[str] = None
+
+class SanctionsPage(BaseModel):
+    items: List[SanctionedEntity]
+    next_cursor: Optional[str] = None
+    total: Optional[int] = None
+
+# Upper bound on addresses per /risk/screen call
+MAX_SCREEN_BATCH = 10000
+
+class ScreenAddress(BaseModel):
+    address: str
+    chain: Optional[str] = None
+
+class ScreenRequest(BaseModel):
+    addresses: List[ScreenAddress] = Field(..., max_length=MAX_SCREEN_BATCH)
 
 @router.get("/stats")
-def get_risk_stats():
+async def get_risk_stats(request: Request):
     """
     Returns high-level risk statistics.
     """
-    conn = get_db_connection(read_only=True)
-    try:
-        total_entities = conn.execute("SELECT COUNT(*) FROM dim_sanctions_entity").fetchone()[0]
-        total_addresses = conn.execute("SELECT COUNT(*) FROM fact_sanctioned_addresses").fetchone()[0]
-        return {
-            "total_entities": total_entities,
-            "total_addresses": total_addresses
-        }
-    finally:
-        conn.close()
+    return await cached_response(request, SANCTIONS_SOURCES, query_risk_stats)
+
+def query_risk_stats(conn):
+    total_entities = conn.execute("SELECT COUNT(*) FROM dim_sanctions_entity").fetchone()[0]
+    total_addresses = conn.execute("SELECT COUNT(*) FROM fact_sanctioned_addresses").fetchone()[0]
+    return {
+        "total_entities": total_entities,
+        "total_addresses": total_addresses
+    }
 
 @router.get("/sanctions/summary", response_model=List[SanctionsSummary])
-def get_sanctions_summary():
+async def get_sanctions_summary(request: Request):
     """
     Returns count of sanctioned addresses per chain.
     """
-    conn = get_db_connection(read_only=True)
-    try:
-        query = """
-            SELECT chain, COUNT(*) as count
-            FROM fact_sanctioned_addresses
-            GROUP BY chain
-            ORDER BY count DESC
-        """
-        rows = conn.execute(query).fetchall()
-        return [{"chain": r[0], "count": r[1]} for r in rows]
-    finally:
-        conn.close()
+    return await cached_response(request, SANCTIONS_SOURCES, query_sanctions_summary, model=List[SanctionsSummary])
+
+def query_sanctions_summary(conn):
+    query = """
+        SELECT chain, COUNT(*) as count
+        FROM fact_sanctioned_addresses
+        GROUP BY chain
+        ORDER BY count DESC
+    """
+    return fetch_records(conn, query)
 
 @router.get("/filters")
-def get_risk_filters():
+async def get_risk_filters(request: Request):
     """
     Returns unique values for filtering (Attributes, Authorities).
     """
-    conn = get_db_connection(read_only=True)
+    return await cached_response(request, SANCTIONS_SOURCES, query_risk_filters)
+
+def query_risk_filters(conn):
+    authorities = conn.execute("SELECT DISTINCT authority FROM dim_sanctions_entity ORDER BY authority").fetchall()
+    return {
+        "authorities": [r[0] for r in authorities]
+    }
+
+# Count results are cached per filter set until the next sanctions ingest.
+# Queries run on several lane threads, so this uses the locked LRU.
+TOTAL_CACHE_SIZE = 256
+_total_cache = ResponseCache(max_entries=TOTAL_CACHE_SIZE)
+
+def encode_cursor(score, listed_date, entity_id):
+    payload = json.dumps([score, listed_date.isoformat(), entity_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor):
     try:
-        authorities = conn.execute("SELECT DISTINCT authority FROM dim_sanctions_entity ORDER BY authority").fetchall()
-        return {
-            "authorities": [r[0] for r in authorities]
-        }
-    finally:
-        conn.close()
+        score, listed_date, entity_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), datetime.fromisoformat(listed_date), entity_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-@router.get("/sanctions/latest")
-def get_latest_sanctions(limit: int = 50, offset: int = 0, search: str = None, authority: str = None):
+def _matched_sql(search, authority):
     """
-    Returns latest sanctioned entities with their addresses.
-    Supports search (by name or address), filtering, and pagination.
+    Returns (sql, params) for a WITH clause ending in
+    matched(entity_id, address, chain, listed_date, score).
+    Searches go through the precomputed search index (api/search.py) and
+    only read the fact rows of the entities it hit; without a search
+    every row scores 0.
     """
-    conn = get_db_connection(read_only=True)
-    try:
-        params = []
+    ctes = []
+    params = []
+    source = "fact_sanctioned_addresses f"
+    joins = ""
+    score = "0.0::DOUBLE"
+    where_parts = []
+
+    if search:
+        hits_sql, hits_params = search_hits_sql(search)
+        ctes.append(hits_sql)
+        ctes.append("""
+            hit_ids AS (
+                SELECT entity_id FROM name_hits
+                UNION
+                SELECT entity_id FROM address_hits
+            )
+        """)
+        params.extend(hits_params)
+        # The hit set is the build side of the join, so the fact scan is
+        # filtered on its entity ids; the outer joins only score those rows
+        source = "hit_ids h JOIN fact_sanctioned_addresses f ON f.entity_id = h.entity_id"
+        joins = """
+            LEFT JOIN name_hits n ON n.entity_id = f.entity_id
+            LEFT JOIN address_hits a ON a.address = f.address AND a.entity_id = f.entity_id
+        """
+        score = "GREATEST(COALESCE(n.score, 0), COALESCE(a.score, 0))::DOUBLE"
+        # Entities hit only by address list just the matching addresses
+        where_parts.append("(n.entity_id IS NOT NULL OR a.entity_id IS NOT NULL)")
+
+    if authority:
+        where_parts.append("e.authority = ?")
+        params.append(authority)
+
+    where_clause = ""
+    if where_parts:
+        where_clause = "WHERE " + " AND ".join(where_parts)
+
+    ctes.append(f"""
+        matched AS (
+            SELECT f.entity_id, f.address, f.chain, f.listed_date, {score} as score
+            FROM {source}
+            JOIN dim_sanctions_entity e ON f.entity_id = e.entity_id
+            {joins}
+            {where_clause}
+        )
+    """)
+    return "WITH " + ",".join(ctes), params
+
+def _page_sql(search, authority, page_key):
+    """
+    Returns (sql, params) selecting the page's (entity_id, score, latest)
+    after `page_key`, in page order; the caller appends the LIMIT.
+
+    Without a search the sort key is precomputed per entity in
+    search_entity_order (see ingest/search_index.py), so the cursor is a
+    range predicate and deep pages cost the same as the first. Search
+    scores depend on the query, so hit entities are ranked on every page;
+    the hit set is what bounds that work.
+    """
+    params = []
+    if not search:
         where_parts = []
-        
-        if search:
-            search_term = f"%{search}%"
-            where_parts.append("(e.name ILIKE ? OR f.address ILIKE ?)")
-            params.extend([search_term, search_term])
-            
         if authority:
-            where_parts.append("e.authority = ?")
+            where_parts.append("authority = ?")
             params.append(authority)
-            
+        if page_key:
+            _, cursor_date, cursor_entity = page_key
+            where_parts.append("(latest < ? OR (latest = ? AND entity_id < ?))")
+            params.extend([cursor_date, cursor_date, cursor_entity])
         where_clause = ""
         if where_parts:
             where_clause = "WHERE " + " AND ".join(where_parts)
-            
-        # Get Total Count for Pagination
-        count_query = f"""
-            SELECT COUNT(*)
-            FROM fact_sanctioned_addresses f
-            JOIN dim_sanctions_entity e ON f.entity_id = e.entity_id
+        sql = f"""
+            SELECT entity_id, 0.0::DOUBLE as score, latest
+            FROM search_entity_order
             {where_clause}
+            ORDER BY latest DESC, entity_id DESC
+            LIMIT ?
         """
-        
-        count_params = list(params) 
-        total_count = conn.execute(count_query, count_params).fetchone()[0]
-
-        # Now add limit/offset for the main query
-        params.extend([limit, offset])
-
-        query = f"""
-            SELECT 
-                e.entity_id, e.name, e.program, e.authority, e.opencorporates_search_url, e.source_url,
-                f.address, f.chain, f.listed_date
-            FROM fact_sanctioned_addresses f
-            JOIN dim_sanctions_entity e ON f.entity_id = e.entity_id
-            {where_clause}
-            ORDER BY f.listed_date DESC
-            LIMIT ? OFFSET ?
+        return sql, params
+
+    having_clause = ""
+    if page_key:
+        cursor_score, cursor_date, cursor_entity = page_key
+        having_clause = """
+            HAVING score < ?
+                OR (score = ? AND (latest < ? OR (latest = ? AND entity_id < ?)))
         """
-        rows = conn.execute(query, params).fetchall()
-        
-        # Group by entity
-        results = {}
-        for r in rows:
-            eid = r[0]
-            if eid not in results:
-                results[eid] = {
-                    "entity_id": eid,
-                    "name": r[1],
-                    "program": r[2],
-                    "authority": r[3],
-                    "opencorporates_search_url": r[4],
-                    "source_url": r[5],
-                    "addresses": []
-                }
-            results[eid]["addresses"].append({
-                "address": r[6], 
-                "chain": r[7],
-                "date": r[8]
+        params.extend([cursor_score, cursor_score, cursor_date, cursor_date, cursor_entity])
+    sql = f"""
+        SELECT
+            entity_id,
+            MAX(score) as score,
+            COALESCE(MAX(listed_date), TIMESTAMP '1970-01-01') as latest
+        FROM matched
+        GROUP BY entity_id
+        {having_clause}
+        ORDER BY score DESC, latest DESC, entity_id DESC
+        LIMIT ?
+    """
+    return sql, params
+
+def _cached_total(conn, with_sql, params, key):
+    generations = get_generations(conn)
+    cache_key = (key, tuple(generations.get(s, 0) for s in SANCTIONS_SOURCES))
+    total = _total_cache.get(cache_key)
+    if total is None:
+        total = conn.execute(f"""
+            {with_sql}
+            SELECT COUNT(DISTINCT entity_id) FROM matched
+        """, params).fetchone()[0]
+        _total_cache.put(cache_key, total)
+    return total
+
+@router.get("/sanctions/latest", response_model=SanctionsPage)
+async def get_latest_sanctions(
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: str = None,
+    search: str = None,
+    authority: str = None,
+    include_total: bool = False
+):
+    """
+    Returns latest sanctioned entities with their addresses.
+    Supports search (by name or address), filtering, and keyset pagination.
+
+    Pages are whole entities ordered by search relevance, then by their
+    most recent listing, so an entity's addresses never straddle two
+    pages. Pass `next_cursor` from the previous response as `cursor` to
+    fetch the next page. Unsearched pages are a seek on a precomputed
+    sort key; searches rank their hits on every page (see _page_sql).
+    The total entity count is only computed when `include_total` is set.
+    """
+    page_key = decode_cursor(cursor) if cursor else None
+    page = await run_query(
+        request, query_latest_sanctions, limit, page_key, search, authority, include_total,
+        lane="heavy"
+    )
+    return json_response(page, SanctionsPage)
+
+def query_latest_sanctions(conn, limit, page_key, search, authority, include_total):
+    with_sql, params = _matched_sql(search, authority)
+
+    total = None
+    if include_total:
+        total = _cached_total(conn, with_sql, list(params), (search, authority))
+
+    page_sql, page_params = _page_sql(search, authority, page_key)
+    # One extra entity tells us whether there is a next page
+    page_params.append(limit + 1)
+
+    query = f"""
+        {with_sql},
+        page AS ({page_sql})
+        SELECT
+            e.entity_id, e.name, e.program, e.authority, e.opencorporates_search_url, e.source_url,
+            list({{'address': m.address, 'chain': m.chain, 'date': m.listed_date}} ORDER BY m.listed_date DESC, m.address) as addresses,
+            p.score as _score, p.latest as _latest
+        FROM page p
+        JOIN matched m ON m.entity_id = p.entity_id
+        JOIN dim_sanctions_entity e ON e.entity_id = p.entity_id
+        GROUP BY ALL
+        ORDER BY _score DESC, _latest DESC, e.entity_id DESC
+    """
+    # Addresses are grouped per entity in DuckDB, so rows arrive already
+    # shaped as response items
+    items = fetch_records(conn, query, params + page_params)
+
+    next_cursor = None
+    has_more = len(items) > limit
+    items = items[:limit]
+    if has_more and items:
+        last = items[-1]
+        next_cursor = encode_cursor(last["_score"], last["_latest"], last["entity_id"])
+    for item in items:
+        del item["_score"], item["_latest"]
+
+    return {
+        "items": items,
+        "next_cursor": next_cursor,
+        "total": total
+    }
+
+@router.post("/screen")
+def screen_addresses(request: ScreenRequest):
+    """
+    Screens a batch of (address, chain) pairs against all sanctioned addresses.
+    Served from the in-memory screening index; only hits are returned.
+    """
+    try:
+        screening_index.ensure_ready()
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Screening index unavailable: {e}")
+
+    matches = []
+    for item in request.addresses:
+        hits = screening_index.screen(item.address, item.chain)
+        if hits:
+            matches.append({
+                "address": item.address,
+                "chain": item.chain,
+                "matches": hits
             })
-            
-        return {
-            "items": list(results.values()),
-            "total": total_count
-        }
-    finally:
-        conn.close()
+
+    return json_response({
+        "screened": len(request.addresses),
+        "matched": len(matches),
+        "results": matches,
+        "index": screening_index.stats()
+    })
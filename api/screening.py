@@ -0,0 +1,102 @@
+import logging
+from api.derived import DerivedState
+
+logger = logging.getLogger(__name__)
+
+# Sources that feed fact_sanctioned_addresses
+SANCTIONS_SOURCES = ("ofac", "opensanctions", "cryptoscamdb")
+
+# Connectors store chains inconsistently (OFAC currency codes, OpenSanctions
+# currencies, CryptoScamDB tickers). Fold the common ones onto one name.
+CHAIN_ALIASES = {
+    "XBT": "BITCOIN",
+    "BTC": "BITCOIN",
+    "ETH": "ETHEREUM",
+    "TRX": "TRON",
+    "LTC": "LITECOIN",
+    "XMR": "MONERO",
+    "BSC": "BINANCE SMART CHAIN",
+    "BNB": "BINANCE SMART CHAIN",
+}
+
+def normalize_address(address):
+    """
+    EVM addresses are case-insensitive hex; everything else (base58, bech32
+    with checksums) is matched exactly.
+    """
+    address = address.strip()
+    if address[:2].lower() == "0x":
+        return address.lower()
+    return address
+
+def normalize_chain(chain):
+    if not chain:
+        return None
+    chain = chain.strip().upper()
+    return CHAIN_ALIASES.get(chain, chain)
+
+class ScreeningIndex(DerivedState):
+    """
+    In-memory hash index over fact_sanctioned_addresses.
+
+    Built once from the warehouse and swapped in whole when any sanctions
+    source reports a new generation, so lookups are a dict probe and never
+    touch DuckDB.
+    """
+
+    name = "screening-index"
+    sources = SANCTIONS_SOURCES
+
+    def load(self, conn):
+        rows = conn.execute("""
+            SELECT
+                f.address, f.chain, f.entity_id, e.name, e.authority,
+                f.source_ref, f.confidence_score
+            FROM fact_sanctioned_addresses f
+            LEFT JOIN dim_sanctions_entity e ON f.entity_id = e.entity_id
+            WHERE f.address IS NOT NULL
+        """).fetchall()
+
+        index = {}
+        for r in rows:
+            key = normalize_address(r[0])
+            if not key:
+                continue
+            match = {
+                "address": r[0],
+                "chain": r[1],
+                "entity_id": r[2],
+                "entity_name": r[3],
+                "authority": r[4],
+                "source_ref": r[5],
+                "confidence_score": r[6],
+            }
+            index.setdefault(key, []).append(match)
+
+        logger.info(f"Screening index built: {len(index)} addresses from {len(rows)} rows.")
+        return index
+
+    def screen(self, address, chain=None):
+        """
+        Returns every listing for `address`. Matches on other chains are
+        still returned (flagged via chain_match) since the same key is
+        often reused across EVM chains.
+        """
+        hits = (self._state or {}).get(normalize_address(address))
+        if not hits:
+            return []
+        wanted = normalize_chain(chain)
+        results = []
+        for hit in hits:
+            match = dict(hit)
+            match["chain_match"] = wanted is None or normalize_chain(hit["chain"]) == wanted
+            results.append(match)
+        return results
+
+    def stats(self):
+        stats = super().stats()
+        stats["addresses"] = len(self._state or {})
+        return stats
+
+# Per-process index used by the API
+screening_index = ScreeningIndex()
@@ -0,0 +1,83 @@
+import re
+from math import ceil
+
+# Share of the query's trigrams an entity name must contain to match
+MIN_TRIGRAM_OVERLAP = 0.7
+
+# Shorter address fragments would match a large part of the list ("0x")
+MIN_ADDRESS_PREFIX = 4
+
+def normalize_name(text):
+    """
+    Must stay in sync with ingest.search_index.NAME_NORM_SQL.
+    """
+    return re.sub(r"[\W_]+", " ", text.lower()).strip()
+
+def query_trigrams(search):
+    """
+    Trigrams for a (possibly partial) search string. Only the start is
+    padded: the last word is usually still being typed.
+    """
+    norm = normalize_name(search)
+    if not norm:
+        return []
+    padded = " " + norm
+    return sorted({padded[i:i + 3] for i in range(len(padded) - 2)})
+
+def _prefix_upper_bound(prefix):
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def search_hits_sql(search):
+    """
+    Returns (sql, params) defining two CTEs over the precomputed search
+    tables (see ingest/search_index.py):
+
+        name_hits(entity_id, score)             - trigram match on names
+        address_hits(address, entity_id, score) - address prefix match
+
+    Name scores are the Dice coefficient between query and name trigrams;
+    an exact address match scores 1.0 and a prefix match 0.9.
+    """
+    params = []
+
+    trigrams = query_trigrams(search)
+    if trigrams:
+        name_sql = """
+            SELECT t.entity_id, 2.0 * COUNT(*) / (? + n.trigram_count) as score
+            FROM search_name_trigrams t
+            JOIN search_names n ON n.entity_id = t.entity_id
+            WHERE t.trigram IN (SELECT unnest(?::VARCHAR[]))
+            GROUP BY t.entity_id, n.trigram_count
+            HAVING COUNT(*) >= ?
+        """
+        min_overlap = ceil(len(trigrams) * MIN_TRIGRAM_OVERLAP)
+        params.extend([len(trigrams), trigrams, min_overlap])
+    else:
+        # One or two characters: too short for trigrams, match word starts
+        norm = normalize_name(search)
+        name_sql = """
+            SELECT entity_id, 0.5::DOUBLE as score
+            FROM search_names
+            WHERE ? <> '' AND (starts_with(name_norm, ?) OR contains(name_norm, ' ' || ?))
+        """
+        params.extend([norm, norm, norm])
+
+    prefix = search.strip().lower()
+    if len(prefix) >= MIN_ADDRESS_PREFIX and " " not in prefix:
+        address_sql = """
+            SELECT address, entity_id, CASE WHEN address_lc = ? THEN 1.0 ELSE 0.9 END::DOUBLE as score
+            FROM search_addresses
+            WHERE address_lc >= ? AND address_lc < ?
+        """
+        params.extend([prefix, prefix, _prefix_upper_bound(prefix)])
+    else:
+        address_sql = """
+            SELECT NULL::VARCHAR as address, NULL::VARCHAR as entity_id, 0.0::DOUBLE as score
+            WHERE false
+        """
+
+    sql = f"""
+        name_hits AS ({name_sql}),
+        address_hits AS ({address_sql})
+    """
+    return sql, params
@@ -0,0 +1,117 @@
+import logging
+from datetime import datetime, timedelta
+import numpy as np
+from api.derived import DerivedState
+from api.downsample import lttb_indices
+
+logger = logging.getLogger(__name__)
+
+# Sources that feed fact_supply
+SERIES_SOURCES = ("defillama",)
+
+# Chain label DefiLlama uses for an asset's aggregate supply
+TOTAL_CHAIN = "Total"
+
+class SeriesStore(DerivedState):
+    """
+    Memory-resident supply series per (asset, chain).
+
+    Each series is a pair of NumPy arrays (datetime64[s] timestamps and
+    float64 supply) sorted by time, so a drill-down is a binary search and
+    a slice rather than a scan of fact_supply. The whole store is rebuilt
+    and swapped in when defillama reports a new generation.
+    """
+
+    name = "series-store"
+    sources = SERIES_SOURCES
+
+    def load(self, conn):
+        assets = {
+            r[0]: {"symbol": r[1], "name": r[2], "chains": {}}
+            for r in conn.execute("SELECT asset_id, symbol, name FROM dim_assets").fetchall()
+        }
+        columns = conn.execute("""
+            SELECT asset_id, chain, timestamp, supply
+            FROM fact_supply
+            WHERE source = 'defillama' AND supply IS NOT NULL
+            ORDER BY asset_id, chain, timestamp
+        """).fetchnumpy()
+
+        asset_ids = np.asarray(columns["asset_id"], dtype=object)
+        chains = np.asarray(columns["chain"], dtype=object)
+        timestamps = np.asarray(columns["timestamp"]).astype("datetime64[s]")
+        supply = np.asarray(columns["supply"], dtype=np.float64)
+
+        # Rows are sorted by (asset, chain); split at every key change
+        n = len(asset_ids)
+        if n:
+            changed = (asset_ids[1:] != asset_ids[:-1]) | (chains[1:] != chains[:-1])
+            starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+            ends = np.append(starts[1:], n)
+        else:
+            starts = ends = []
+
+        for start, end in zip(starts, ends):
+            asset = assets.setdefault(asset_ids[start], {"symbol": None, "name": None, "chains": {}})
+            # Copies, so the fetched columns can be freed
+            asset["chains"][chains[start]] = (timestamps[start:end].copy(), supply[start:end].copy())
+
+        logger.info(f"Series store built: {len(assets)} assets, {n} points.")
+        return assets
+
+    def asset(self, asset_id, days=None, chain=None, max_points=None):
+        """
+        Returns current supply and per-chain history for one asset shaped
+        like AssetSupplyResponse, or None if the asset is unknown.
+        History covers the last `days` days and each chain is reduced
+        to `max_points` points with LTTB.
+        """
+        asset = (self._state or {}).get(asset_id)
+        if asset is None:
+            return None
+
+        series = asset["chains"]
+        if TOTAL_CHAIN in series:
+            current_supply = float(series[TOTAL_CHAIN][1][-1])
+        else:
+            current_supply = float(sum(values[-1] for _, values in series.values()))
+
+        cutoff = None
+        if days is not None:
+            cutoff = np.datetime64(datetime.now() - timedelta(days=days), "s")
+
+        history = []
+        for chain_name, (timestamps, values) in sorted(series.items()):
+            if chain is not None and chain_name != chain:
+                continue
+            if cutoff is not None:
+                first = np.searchsorted(timestamps, cutoff)
+                timestamps, values = timestamps[first:], values[first:]
+            if max_points is not None:
+                keep = lttb_indices(timestamps.astype(np.int64), values, max_points)
+                timestamps, values = timestamps[keep], values[keep]
+            history.extend(
+                {"timestamp": ts, "supply": value, "chain": chain_name}
+                for ts, value in zip(timestamps.astype("datetime64[us]").tolist(), values.tolist())
+            )
+
+        return {
+            "asset_id": asset_id,
+            "symbol": asset["symbol"] or asset_id,
+            "name": asset["name"] or asset_id,
+            "current_supply": current_supply,
+            "history": history,
+        }
+
+    def stats(self):
+        stats = super().stats()
+        assets = self._state or {}
+        series = [s for asset in assets.values() for s in asset["chains"].values()]
+        stats["assets"] = len(assets)
+        stats["series"] = len(series)
+        stats["points"] = sum(len(ts) for ts, _ in series)
+        stats["bytes"] = sum(ts.nbytes + values.nbytes for ts, values in series)
+        return stats
+
+# Per-process store used by the API
+series_store = SeriesStore()
@@ -0,0 +1,223 @@
+import io
+import re
+import csv
+import json
+import time
+import zlib
+from datetime import date, datetime
+from urllib.parse import quote
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+from api.executor import open_stream
+from api.metrics import observe_query
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+
+# Rows per Arrow record batch (and per Parquet row group)
+BATCH_ROWS = 65536
+
+# Rows per fetchmany() call for text exports
+FETCH_ROWS = 10000
+
+# Query pattern for the `format` parameter of history endpoints
+FORMAT_PATTERN = "^(json|arrow|parquet)$"
+BINARY_FORMAT_PATTERN = "^(arrow|parquet)$"
+TEXT_FORMAT_PATTERN = "^(ndjson|csv)$"
+
+def content_disposition(filename):
+    """
+    Attachment header for `filename`, which may contain user input (e.g.
+    an asset id). The plain `filename` keeps only [A-Za-z0-9._-]; the
+    RFC 5987 `filename*` carries the original name for clients that
+    support it.
+    """
+    fallback = re.sub(r"[^A-Za-z0-9._-]", "_", filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file object that hands back whatever was written since
+    the last drain, so writers can be streamed without buffering the file.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def _record_batch_reader(conn, rows):
+    # to_arrow_reader() replaced fetch_record_batch() in DuckDB 1.4
+    if hasattr(conn, "to_arrow_reader"):
+        return conn.to_arrow_reader(rows)
+    return conn.fetch_record_batch(rows)
+
+def iter_arrow(conn, sql, params, fmt, name="stream"):
+    """
+    Runs `sql` on `conn` and yields the result encoded as an Arrow IPC
+    stream or a Parquet file, one record batch at a time.
+    Rows never become Python objects.
+    """
+    start = time.perf_counter()
+    rows = 0
+    conn.execute(sql, params)
+    reader = _record_batch_reader(conn, BATCH_ROWS)
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, reader.schema)
+    else:
+        writer = pa.ipc.new_stream(sink, reader.schema)
+    try:
+        for batch in reader:
+            rows += batch.num_rows
+            writer.write_batch(batch)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.drain()
+    # Includes time spent waiting on the client between batches
+    observe_query(name, time.perf_counter() - start, rows)
+
+class QueryStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse over a QueryStream (see api.executor.open_stream).
+    The stream is closed however the response ends (completed, client
+    gone or never sent), which releases its cursor and lane slot.
+    """
+
+    def __init__(self, stream, **kwargs):
+        super().__init__(stream, **kwargs)
+        self.stream = stream
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.stream.close()
+
+async def arrow_response(request, sql, params, fmt, filename, name="stream", lane="heavy"):
+    """
+    Streams `iter_arrow` from a cursor in `lane`, under the route's
+    concurrency limit. If the client goes away Starlette stops
+    iterating and the query is interrupted.
+    """
+    if fmt == "parquet":
+        media_type, extension = PARQUET_MEDIA_TYPE, "parquet"
+    else:
+        media_type, extension = ARROW_MEDIA_TYPE, "arrow"
+    stream = await open_stream(request, iter_arrow, sql, params, fmt, name, lane=lane)
+    return QueryStreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition(f"{filename}.{extension}")}
+    )
+
+def table_response(columns, fmt, filename):
+    """
+    Arrow IPC / Parquet response for an already reduced result held as
+    NumPy columns (e.g. a downsampled series).
+    """
+    table = pa.table({name: pa.array(values) for name, values in columns.items()})
+    sink = pa.BufferOutputStream()
+    if fmt == "parquet":
+        pq.write_table(table, sink)
+        media_type, extension = PARQUET_MEDIA_TYPE, "parquet"
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        media_type, extension = ARROW_MEDIA_TYPE, "arrow"
+    return Response(
+        content=sink.getvalue().to_pybytes(),
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition(f"{filename}.{extension}")}
+    )
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+def _encode_ndjson(columns, rows):
+    return "".join(
+        json.dumps(dict(zip(columns, row)), default=_json_default) + "\n"
+        for row in rows
+    )
+
+def _encode_csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        [v.isoformat() if isinstance(v, (datetime, date)) else v for v in row]
+        for row in rows
+    )
+    return buffer.getvalue()
+
+def iter_text(conn, sql, params, fmt, compress=False, name="stream"):
+    """
+    Runs `sql` on `conn` and yields NDJSON or CSV, fetching FETCH_ROWS
+    rows at a time so memory stays flat however large the result is.
+    With `compress` the output is a gzip stream.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    start = time.perf_counter()
+    total = 0
+
+    def emit(text):
+        data = text.encode()
+        return compressor.compress(data) if compressor else data
+
+    conn.execute(sql, params)
+    columns = [d[0] for d in conn.description]
+    if fmt == "csv":
+        yield emit(_encode_csv([columns]))
+    while True:
+        rows = conn.fetchmany(FETCH_ROWS)
+        if not rows:
+            break
+        total += len(rows)
+        if fmt == "csv":
+            chunk = emit(_encode_csv(rows))
+        else:
+            chunk = emit(_encode_ndjson(columns, rows))
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+    observe_query(name, time.perf_counter() - start, total)
+
+async def text_response(request, sql, params, fmt, filename, compress=False, name="stream", lane="heavy"):
+    """
+    Streams `iter_text` from a cursor in `lane`, like arrow_response.
+    Compressed exports are served as .gz files rather than with
+    Content-Encoding, so downloads stay gzipped.
+    """
+    if fmt == "csv":
+        media_type, extension = "text/csv", "csv"
+    else:
+        media_type, extension = "application/x-ndjson", "ndjson"
+    if compress:
+        media_type, extension = "application/gzip", extension + ".gz"
+    stream = await open_stream(request, iter_text, sql, params, fmt, compress, name, lane=lane)
+    return QueryStreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition(f"{filename}.{extension}")}
+    )
@@ -27,6 +27,8 @@ export function RiskExplorer() {
 
     const [debouncedSearch, setDebouncedSearch] = useState("");
     const [page, setPage] = useState(0);
+    // cursors[i] is the keyset cursor that fetches page i (page 0 has none)
+    const [cursors, setCursors] = useState<(string | null)[]>([null]);
     const LIMIT = 50;
 
     const [total, setTotal] = useState(0);
@@ -46,6 +48,7 @@ export function RiskExplorer() {
         const timer = setTimeout(() => {
             setDebouncedSearch(search);
             setPage(0); // Reset to page 0 on new search
+            setCursors([null]);
         }, 500);
         return () => clearTimeout(timer);
     }, [search]);
@@ -54,11 +57,16 @@ export function RiskExplorer() {
         async function fetchData() {
             setLoading(true);
             try {
-                const offset = page * LIMIT;
                 const params = new URLSearchParams({
-                    limit: LIMIT.toString(),
-                    offset: offset.toString()
+                    limit: LIMIT.toString()
                 });
+                const cursor = cursors[page];
+                if (cursor) {
+                    params.append("cursor", cursor);
+                } else {
+                    // Only the first page pays for the (cached) count
+                    params.append("include_total", "true");
+                }
                 if (debouncedSearch) {
                     params.append("search", debouncedSearch);
                 }
@@ -69,17 +77,16 @@ export function RiskExplorer() {
                 const res = await fetch(`http://127.0.0.1:8000/risk/sanctions/latest?${params.toString()}`);
                 if (res.ok) {
                     const json = await res.json();
-                    // New API returns { items: [], total: number }
-                    // OR if old API, it returns []. We should handle both temporarily or assume new.
-                    // Let's assume new since we just updated providing a robust fix.
-                    if (Array.isArray(json)) {
-                        // Fallback/Legacy
-                        setData(json);
-                        setTotal(json.length); // inexact but safe
-                    } else {
-                        setData(json.items);
+                    // API returns { items: [], next_cursor: string | null, total: number | null }
+                    setData(json.items);
+                    if (json.total !== null && json.total !== undefined) {
                         setTotal(json.total);
                     }
+                    setCursors(prev => {
+                        const next = prev.slice(0, page + 1);
+                        next[page + 1] = json.next_cursor;
+                        return next;
+                    });
                 }
             } catch (e) {
                 console.error("Failed to fetch risk data", e);
@@ -118,6 +125,7 @@ export function RiskExplorer() {
                         onChange={(e) => {
                             setAuthority(e.target.value);
                             setPage(0);
+                            setCursors([null]);
                         }}
                     >
                         <option value="">All Authorities</option>
@@ -145,7 +153,7 @@ export function RiskExplorer() {
                         </button>
                         <button
                             onClick={() => setPage(p => p + 1)}
-                            disabled={loading || page >= totalPages - 1}
+                            disabled={loading || !cursors[page + 1]}
                             className="px-3 py-1.5 text-sm font-medium text-zinc-700 dark:text-zinc-300 bg-white dark:bg-zinc-800 border border-zinc-300 dark:border-zinc-700 rounded-md hover:bg-zinc-50 dark:hover:bg-zinc-700 disabled:opacity-50 disabled:cursor-not-allowed"
                         >
                             Next
@@ -0,0 +1,162 @@
+import os
+import time
+import argparse
+import logging
+from api.db import init_db, get_db_connection, bump_generation, publish_snapshot
+from ingest.rollups import rebuild_supply_daily, rebuild_current_supply
+from ingest.search_index import rebuild_search_index
+
+logger = logging.getLogger("benchmarks.generate")
+
+# Benchmark data lives apart from the real warehouse; point the API at it
+# with STABLETRACE_DB_PATH (benchmarks/load.py --serve does this).
+DEFAULT_DB = "benchmarks/data/stabletrace.duckdb"
+
+# Words the entity names are drawn from, so name search has realistic
+# overlap between entities
+NAME_WORDS = [
+    "Global", "Trade", "Capital", "Holdings", "Group", "Ventures", "Digital",
+    "Asset", "Finance", "Exchange", "Mining", "Logistics", "Shipping",
+    "Energy", "Petro", "Aero", "Tech", "Systems", "Partners", "Network",
+    "Alpha", "Nova", "Orion", "Atlas", "Delta", "Vector", "Falcon", "Zenith",
+]
+
+# (source_ref, authority, entity prefix, confidence) per sanctions source
+SANCTIONS_SOURCES = [
+    ("OFAC SDN", "OFAC", "", 1.0),
+    ("OpenSanctions", "us_ofac_sdn", "OS-", 1.0),
+    ("CryptoScamDB", "CryptoScamDB", "CSDB-", 0.9),
+]
+
+CHAINS = ["Ethereum", "Bitcoin", "Tron", "Litecoin", "Monero"]
+
+def generate_assets(conn, assets, years):
+    """
+    `assets` stablecoins with hourly supply and price points over `years`.
+    Supplies follow a per-asset trend plus a daily cycle and noise.
+    """
+    conn.execute(f"""
+        INSERT INTO dim_assets (asset_id, symbol, name, coingecko_id, defillama_id, chain, category, last_updated)
+        SELECT i::VARCHAR, 'SYN' || i, 'Synthetic Stable ' || i, 'synthetic-' || i, i::VARCHAR, 'Multi', 'stablecoin', now()
+        FROM range(1, {assets} + 1) t(i)
+    """)
+    # Generated hour by hour so the table is laid out in time order, as
+    # ingest would write it
+    conn.execute(f"""
+        CREATE TEMP TABLE bench_hours AS
+        SELECT unnest(range(now()::TIMESTAMP - INTERVAL {int(years * 365)} DAY, now()::TIMESTAMP, INTERVAL 1 HOUR)) AS ts
+    """)
+    conn.execute(f"""
+        INSERT INTO fact_supply (timestamp, asset_id, chain, supply, source, ingested_at)
+        SELECT
+            h.ts,
+            a.i::VARCHAR,
+            'Total',
+            (1e10 / a.i) * (1 + 0.2 * (epoch(h.ts) - epoch(now())) / (86400 * 365 * {years}) * (a.i % 3 - 1))
+                * (1 + 0.002 * sin(epoch(h.ts) / 3600 * pi() / 12)) * (1 + 0.001 * random()),
+            'defillama',
+            h.ts
+        FROM bench_hours h, range(1, {assets} + 1) a(i)
+        ORDER BY h.ts, a.i
+    """)
+    conn.execute(f"""
+        INSERT INTO fact_prices (timestamp, asset_id, price_usd, source, ingested_at)
+        SELECT h.ts, a.i::VARCHAR, 1 + 0.002 * (random() - 0.5), 'defillama', h.ts
+        FROM bench_hours h, range(1, {assets} + 1) a(i)
+        ORDER BY h.ts, a.i
+    """)
+    conn.execute("DROP TABLE bench_hours")
+
+def generate_sanctions(conn, addresses, addresses_per_entity):
+    """
+    `addresses` sanctioned addresses spread over entities of the three
+    sanctions sources. Addresses are deterministic (md5 of the index), so
+    the load harness can screen known hits.
+    """
+    entities = max(1, addresses // addresses_per_entity)
+    words = "[" + ", ".join(f"'{w}'" for w in NAME_WORDS) + "]"
+    refs, authorities, prefixes, confidences = (
+        "[" + ", ".join(f"'{v}'" if isinstance(v, str) else str(v) for v in column) + "]"
+        for column in zip(*SANCTIONS_SOURCES)
+    )
+    chains = "[" + ", ".join(f"'{c}'" for c in CHAINS) + "]"
+
+    conn.execute(f"""
+        CREATE TEMP TABLE bench_entities AS
+        SELECT
+            e,
+            e % {len(SANCTIONS_SOURCES)} + 1 AS src,
+            {words}[(hash(e) % {len(NAME_WORDS)})::BIGINT + 1] || ' ' ||
+            {words}[(hash(e * 7 + 1) % {len(NAME_WORDS)})::BIGINT + 1] || ' ' ||
+            {words}[(hash(e * 13 + 2) % {len(NAME_WORDS)})::BIGINT + 1] || ' ' || e AS name
+        FROM range({entities}) t(e)
+    """)
+    conn.execute(f"""
+        INSERT INTO dim_sanctions_entity (entity_id, name, program, authority, source_url, last_updated, opencorporates_search_url)
+        SELECT
+            {prefixes}[src] || 'SYN' || e, name, 'SYNTHETIC', {authorities}[src], 'https://example.org/' || e, now(),
+            'https://opencorporates.com/companies?q=' || replace(name, ' ', '+')
+        FROM bench_entities
+    """)
+    conn.execute(f"""
+        INSERT INTO fact_sanctioned_addresses (address, chain, entity_id, listed_date, confidence_score, source_ref)
+        SELECT
+            '0x' || md5(i::VARCHAR) || substr(md5((i + 1)::VARCHAR), 1, 8),
+            {chains}[i % {len(CHAINS)} + 1],
+            {prefixes}[src] || 'SYN' || e,
+            now()::TIMESTAMP - to_days((hash(i) % 3650)::INTEGER),
+            {confidences}[src],
+            {refs}[src]
+        FROM range({addresses}) t(i)
+        JOIN bench_entities ON e = i % {entities}
+    """)
+    conn.execute("DROP TABLE bench_entities")
+
+def generate(path=DEFAULT_DB, assets=500, years=3, addresses=2_000_000, addresses_per_entity=5):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with publish_snapshot(path):
+        init_db()
+        conn = get_db_connection()
+        try:
+            for table in (
+                "fact_supply", "fact_prices", "agg_supply_daily", "current_supply", "dim_assets",
+                "fact_sanctioned_addresses", "dim_sanctions_entity", "meta_backfill_state",
+                "src_opensanctions_entities", "src_opensanctions_wallets", "meta_http_state",
+            ):
+                conn.execute(f"DELETE FROM {table}")
+
+            start = time.perf_counter()
+            generate_assets(conn, assets, years)
+            logger.info(f"Generated supply and prices for {assets} assets in {time.perf_counter() - start:.1f}s.")
+
+            start = time.perf_counter()
+            generate_sanctions(conn, addresses, addresses_per_entity)
+            logger.info(f"Generated {addresses} sanctioned addresses in {time.perf_counter() - start:.1f}s.")
+
+            start = time.perf_counter()
+            rebuild_supply_daily(conn)
+            rebuild_current_supply(conn)
+            rebuild_search_index(conn)
+            for source in ("defillama", "coingecko", "ofac", "opensanctions", "cryptoscamdb"):
+                bump_generation(conn, source)
+            conn.commit()
+            logger.info(f"Built rollups and search index in {time.perf_counter() - start:.1f}s.")
+
+            for table in ("fact_supply", "fact_prices", "dim_sanctions_entity", "fact_sanctioned_addresses"):
+                rows = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                logger.info(f"{table}: {rows} rows")
+        finally:
+            conn.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description="Generate a synthetic StableTrace warehouse for benchmarks")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"Database to write (default: {DEFAULT_DB})")
+    parser.add_argument("--assets", type=int, default=500, help="Number of stablecoins")
+    parser.add_argument("--years", type=float, default=3, help="Years of hourly supply and price history")
+    parser.add_argument("--addresses", type=int, default=2_000_000, help="Number of sanctioned addresses")
+    parser.add_argument("--addresses-per-entity", type=int, default=5, help="Average addresses per sanctioned entity")
+
+    args = parser.parse_args()
+
+    generate(args.db, args.assets, args.years, args.addresses, args.addresses_per_entity)
@@ -0,0 +1,285 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import hashlib
+import argparse
+import platform
+import itertools
+import subprocess
+from datetime import datetime, timedelta
+import httpx
+import numpy as np
+from benchmarks.generate import DEFAULT_DB, NAME_WORDS
+
+DEFAULT_URL = "http://127.0.0.1:8000"
+RESULTS_DIR = "benchmarks/results"
+
+# Routes the harness deliberately doesn't drive
+EXCLUDED_ROUTES = {
+    "/debug/slow-queries",  # admin only
+}
+
+def known_address(i):
+    # Matches the addresses written by benchmarks/generate.py
+    return "0x" + hashlib.md5(str(i).encode()).hexdigest() + hashlib.md5(str(i + 1).encode()).hexdigest()[:8]
+
+def build_scenarios(assets, addresses):
+    """
+    (name, route template, method, request factory) per scenario. The
+    factory maps a request counter to (path, params, json body); values
+    rotate so the response cache sees a realistic spread of keys.
+    """
+    def asset(i):
+        return str(i % assets + 1)
+
+    def word(i):
+        return NAME_WORDS[i % len(NAME_WORDS)]
+
+    def screen_batch(i):
+        # Half known hits, half misses
+        batch = [{"address": known_address((i * 100 + j) % addresses)} for j in range(50)]
+        batch += [{"address": f"0x{(i * 100 + j):040x}", "chain": "ETH"} for j in range(50)]
+        return {"addresses": batch}
+
+    recent = (datetime.now() - timedelta(days=30)).isoformat(timespec="seconds")
+
+    return [
+        ("root", "/", "GET", lambda i: ("/", None, None)),
+        ("health", "/health", "GET", lambda i: ("/health", None, None)),
+        ("metrics", "/metrics", "GET", lambda i: ("/metrics", None, None)),
+        ("supply_global", "/supply/global", "GET",
+            lambda i: ("/supply/global", {"days": 30 + i % 335}, None)),
+        ("supply_global_auto", "/supply/global", "GET",
+            lambda i: ("/supply/global", {"days": 1095, "resolution": "auto", "max_points": 200 + i % 800}, None)),
+        ("supply_assets", "/supply/assets", "GET",
+            lambda i: ("/supply/assets", {"limit": 10 + i % 40}, None)),
+        ("supply_asset", "/supply/assets/{asset_id}", "GET",
+            lambda i: (f"/supply/assets/{asset(i)}", {"days": 365}, None)),
+        ("prices_history", "/prices/history", "GET",
+            lambda i: ("/prices/history", {"asset_id": asset(i), "days": 90}, None)),
+        ("prices_history_lttb", "/prices/history", "GET",
+            lambda i: ("/prices/history", {"asset_id": asset(i), "days": 1095, "resolution": "lttb", "max_points": 500}, None)),
+        ("risk_stats", "/risk/stats", "GET", lambda i: ("/risk/stats", None, None)),
+        ("sanctions_summary", "/risk/sanctions/summary", "GET", lambda i: ("/risk/sanctions/summary", None, None)),
+        ("risk_filters", "/risk/filters", "GET", lambda i: ("/risk/filters", None, None)),
+        ("sanctions_latest", "/risk/sanctions/latest", "GET",
+            lambda i: ("/risk/sanctions/latest", {"limit": 50, "include_total": i % 10 == 0}, None)),
+        ("sanctions_search_name", "/risk/sanctions/latest", "GET",
+            lambda i: ("/risk/sanctions/latest", {"limit": 50, "search": f"{word(i)} {word(i * 7 + 3)}"}, None)),
+        ("sanctions_search_address", "/risk/sanctions/latest", "GET",
+            lambda i: ("/risk/sanctions/latest", {"limit": 50, "search": known_address(i % addresses)[:12]}, None)),
+        ("sanctions_authority", "/risk/sanctions/latest", "GET",
+            lambda i: ("/risk/sanctions/latest", {"limit": 50, "authority": ["OFAC", "us_ofac_sdn", "CryptoScamDB"][i % 3]}, None)),
+        ("screen_100", "/risk/screen", "POST", lambda i: ("/risk/screen", None, screen_batch(i))),
+        ("export_supply", "/export/supply", "GET",
+            lambda i: ("/export/supply", {"asset_id": asset(i), "format": "arrow"}, None)),
+        ("export_sanctions_recent", "/export/sanctions", "GET",
+            lambda i: ("/export/sanctions", {"since": recent}, None)),
+    ]
+
+def check_coverage(scenarios):
+    """
+    Warns about API routes without a scenario, so new routes don't
+    silently go unbenchmarked.
+    """
+    from fastapi.routing import APIRoute
+    from api.main import app
+
+    covered = {route for _, route, _, _ in scenarios}
+    for route in app.routes:
+        if isinstance(route, APIRoute) and route.path not in covered and route.path not in EXCLUDED_ROUTES:
+            print(f"warning: no benchmark scenario for {route.path}", file=sys.stderr)
+
+async def run_scenario(client, scenario, concurrency, duration, warmup):
+    """
+    Drives one scenario with `concurrency` workers for `warmup` + `duration`
+    seconds and returns latency percentiles and throughput for the
+    measured part.
+    """
+    name, route, method, make_request = scenario
+    counter = itertools.count()
+    latencies = []
+    errors = 0
+    non_2xx = 0
+    received = 0
+
+    loop = asyncio.get_running_loop()
+    measure_from = loop.time() + warmup
+    stop_at = measure_from + duration
+
+    async def worker():
+        nonlocal errors, non_2xx, received
+        while loop.time() < stop_at:
+            path, params, body = make_request(next(counter))
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, params=params, json=body)
+            except httpx.HTTPError:
+                if loop.time() >= measure_from:
+                    errors += 1
+                continue
+            elapsed = time.perf_counter() - start
+            if loop.time() < measure_from:
+                continue
+            latencies.append(elapsed)
+            received += len(response.content)
+            if not 200 <= response.status_code < 300:
+                non_2xx += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "name": name,
+        "route": route,
+        "method": method,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "non_2xx": non_2xx,
+        "rps": len(latencies) / duration,
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "bytes": received,
+    }
+
+async def run_benchmarks(url, scenarios, concurrencies, duration, warmup):
+    results = []
+    limits = httpx.Limits(max_connections=max(concurrencies), max_keepalive_connections=max(concurrencies))
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        for concurrency in concurrencies:
+            for scenario in scenarios:
+                result = await run_scenario(client, scenario, concurrency, duration, warmup)
+                print_result(result)
+                results.append(result)
+        health = (await client.get("/health")).json()
+    return results, health
+
+def print_result(result, baseline=None):
+    line = (
+        f"{result['name']:<26} c={result['concurrency']:<4} "
+        f"{result['rps']:>9.1f} req/s  p50 {result['p50_ms']:>8.1f}ms  "
+        f"p95 {result['p95_ms']:>8.1f}ms  p99 {result['p99_ms']:>8.1f}ms"
+    )
+    if result["errors"] or result["non_2xx"]:
+        line += f"  errors {result['errors']} non-2xx {result['non_2xx']}"
+    if baseline:
+        rps = (result["rps"] / baseline["rps"] - 1) * 100 if baseline["rps"] else 0.0
+        p95 = (result["p95_ms"] / baseline["p95_ms"] - 1) * 100 if baseline["p95_ms"] else 0.0
+        line += f"  | rps {rps:+.0f}%  p95 {p95:+.0f}%"
+    print(line)
+
+def compare(results, baseline_path):
+    """
+    Prints each result next to the matching run in a saved results file.
+    """
+    with open(baseline_path) as f:
+        baseline = {(r["name"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        print_result(result, baseline.get((result["name"], result["concurrency"])))
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(db, workers):
+    """
+    Starts uvicorn against the benchmark database and waits until the
+    API answers. Returns (process, url).
+    """
+    port = free_port()
+    env = dict(os.environ, STABLETRACE_DB_PATH=db)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("API server exited during startup")
+        try:
+            if httpx.get(f"{url}/health", timeout=5).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("API server did not become healthy within 120s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test every StableTrace API route")
+    parser.add_argument("--url", default=DEFAULT_URL, help=f"API to benchmark (default: {DEFAULT_URL})")
+    parser.add_argument("--serve", action="store_true", help="Start an API server on --db instead of using --url")
+    parser.add_argument("--db", default=DEFAULT_DB, help=f"Database for --serve (default: {DEFAULT_DB})")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for --serve")
+    parser.add_argument("--concurrency", default="1,16", help="Comma-separated concurrency levels (default: 1,16)")
+    parser.add_argument("--duration", type=float, default=10, help="Measured seconds per scenario and level")
+    parser.add_argument("--warmup", type=float, default=2, help="Unmeasured seconds before each scenario")
+    parser.add_argument("--only", help="Comma-separated scenario names to run")
+    parser.add_argument("--assets", type=int, default=500, help="Assets in the benchmark data")
+    parser.add_argument("--addresses", type=int, default=2_000_000, help="Sanctioned addresses in the benchmark data")
+    parser.add_argument("--out", help=f"Results file (default: {RESULTS_DIR}/<timestamp>.json)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+
+    args = parser.parse_args()
+
+    scenarios = build_scenarios(args.assets, args.addresses)
+    check_coverage(scenarios)
+    if args.only:
+        wanted = set(args.only.split(","))
+        scenarios = [s for s in scenarios if s[0] in wanted]
+    concurrencies = [int(c) for c in args.concurrency.split(",")]
+
+    process = None
+    url = args.url
+    if args.serve:
+        process, url = start_server(args.db, args.workers)
+    try:
+        results, health = asyncio.run(run_benchmarks(url, scenarios, concurrencies, args.duration, args.warmup))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    started = datetime.now()
+    out = args.out or os.path.join(RESULTS_DIR, f"{started.strftime('%Y%m%dT%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as f:
+        json.dump({
+            "meta": {
+                "timestamp": started.isoformat(),
+                "revision": git_revision(),
+                "url": url,
+                "db": args.db if args.serve else None,
+                "workers": args.workers if args.serve else None,
+                "concurrency": concurrencies,
+                "duration": args.duration,
+                "warmup": args.warmup,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "series_store": health.get("series_store"),
+                "screening_index": health.get("screening_index"),
+            },
+            "results": results,
+        }, f, indent=2, default=str)
+    print(f"\nSaved results to {out}")
+
+    if args.compare:
+        compare(results, args.compare)
@@ -3,6 +3,8 @@ import logging
 import time
 from datetime import datetime
 from api.db import get_db_connection
+from ingest.metrics import stage, record_rows
+from ingest.loader import staged
 
 logger = logging.getLogger(__name__)
 
@@ -69,22 +71,20 @@ def fetch_coin_metadata(coin_ids):
         logger.error(f"Failed to fetch from CoinGecko: {e}")
         return []
 
+COIN_COLUMNS = ["coingecko_id", "symbol", "name", "image_url", "market_cap_rank", "price_usd"]
+
 def normalize_and_save(coins):
+    """
+    Merges a /coins/markets payload into dim_assets (image, rank) and
+    fact_prices. Coins are resolved to assets in one join: exact
+    coingecko_id first, then symbol for assets without a coingecko_id.
+    Returns the number of prices inserted.
+    """
     conn = get_db_connection()
     timestamp = datetime.now()
     
     logger.info(f"Processing {len(coins)} assets from CoinGecko...")
     
-    # We primarily want to UPDATE dim_assets with images/links if matching,
-    # OR insert new ones if we missed them from DefiLlama (unlikely but possible).
-    # We also want to record prices as a secondary source.
-    
-    # 1. Update dim_assets (image_url, etc - need to add columns to schema first? 
-    # The current schema doesn't have image_url. Let's add it dynamically or just ignore for now and focus on prices/ranking)
-    # Actually, let's update schema to include image_url.
-    
-    price_rows = []
-    
     # Check if column exists, if not add it (Migration Logic - Simplified)
     try:
         conn.execute("ALTER TABLE dim_assets ADD COLUMN IF NOT EXISTS image_url VARCHAR")
@@ -92,52 +92,82 @@ def normalize_and_save(coins):
     except Exception as e:
         logger.warning(f"Schema migration warning: {e}")
 
-    for coin in coins:
-        cg_id = coin.get("id")
-        symbol = coin.get("symbol")
-        name = coin.get("name")
-        image = coin.get("image")
-        rank = coin.get("market_cap_rank")
-        price = coin.get("current_price")
-        
-        # Upsert Metadata
-        # We match on coingecko_id (if we have it) OR symbol (fuzzy).
-        # DefiLlama ingest populated 'coingecko_id'.
-        
+    rows = [
+        (
+            coin.get("id"),
+            coin.get("symbol"),
+            coin.get("name"),
+            coin.get("image"),
+            coin.get("market_cap_rank"),
+            float(coin["current_price"]) if coin.get("current_price") is not None else None,
+        )
+        for coin in coins
+    ]
+
+    with staged(conn, "stg_coingecko", rows, COIN_COLUMNS):
+        # One coin per asset: exact id matches win over symbol matches, then
+        # the better-ranked coin (several coins can share a symbol)
         conn.execute("""
-            UPDATE dim_assets 
-            SET image_url = ?, market_cap_rank = ?, last_updated = ?
-            WHERE coingecko_id = ? OR (coingecko_id IS NULL AND lower(symbol) = lower(?))
-        """, [image, rank, timestamp, cg_id, symbol])
-        
-        # Insert Price
-        if price is not None:
-            # We need the asset_id to insert into fact_prices.
-            # We have to fetch it first.
-            row = conn.execute("SELECT asset_id FROM dim_assets WHERE coingecko_id = ? OR (coingecko_id IS NULL AND lower(symbol) = lower(?))", [cg_id, symbol]).fetchone()
-            
-            if row:
-                asset_id = row[0]
-                price_rows.append((
-                    timestamp,
-                    asset_id,
-                    float(price),
-                    "coingecko",
-                    timestamp
-                ))
+            CREATE OR REPLACE TEMP TABLE cg_matched AS
+            WITH candidates AS (
+                SELECT c.*, a.asset_id, 1 as match_priority
+                FROM stg_coingecko c
+                JOIN dim_assets a ON a.coingecko_id = c.coingecko_id
+                UNION ALL
+                SELECT c.*, a.asset_id, 2 as match_priority
+                FROM stg_coingecko c
+                JOIN dim_assets a ON a.coingecko_id IS NULL AND lower(a.symbol) = lower(c.symbol)
+                WHERE c.coingecko_id NOT IN (SELECT coingecko_id FROM dim_assets WHERE coingecko_id IS NOT NULL)
+            )
+            SELECT * FROM candidates
+            QUALIFY row_number() OVER (
+                PARTITION BY asset_id ORDER BY match_priority, market_cap_rank NULLS LAST, coingecko_id
+            ) = 1
+        """)
+        unmatched = conn.execute("""
+            SELECT coingecko_id FROM stg_coingecko
+            WHERE coingecko_id NOT IN (SELECT coingecko_id FROM dim_assets WHERE coingecko_id IS NOT NULL)
+              AND lower(symbol) NOT IN (SELECT lower(symbol) FROM dim_assets WHERE coingecko_id IS NULL AND symbol IS NOT NULL)
+            ORDER BY market_cap_rank NULLS LAST
+        """).fetchall()
 
-    # Bulk Insert Prices
-    if price_rows:
-        conn.executemany("""
-            INSERT INTO fact_prices (timestamp, asset_id, price_usd, source, ingested_at)
-            VALUES (?, ?, ?, ?, ?)
-        """, price_rows)
-        
+    updated = conn.execute("""
+        UPDATE dim_assets a
+        SET image_url = m.image_url, market_cap_rank = m.market_cap_rank, last_updated = ?
+        FROM cg_matched m
+        WHERE a.asset_id = m.asset_id
+    """, [timestamp]).fetchone()[0]
+
+    prices = conn.execute("""
+        INSERT INTO fact_prices (timestamp, asset_id, price_usd, source, ingested_at)
+        SELECT ?, asset_id, price_usd, 'coingecko', ?
+        FROM cg_matched
+        WHERE price_usd IS NOT NULL
+    """, [timestamp, timestamp]).fetchone()[0]
+
+    conn.execute("DROP TABLE cg_matched")
     conn.commit()
     conn.close()
-    logger.info(f"Updated CoinGecko metadata and inserted {len(price_rows)} prices.")
 
-def ingest_coingecko():
-    data = fetch_coin_metadata([])
+    logger.info(f"Updated CoinGecko metadata for {updated} assets and inserted {prices} prices.")
+    if unmatched:
+        sample = ", ".join(r[0] for r in unmatched[:20])
+        logger.info(f"{len(unmatched)} CoinGecko coins matched no asset (e.g. {sample}).")
+    record_rows("coingecko", "unmatched", len(unmatched))
+    return prices
+
+def fetch_coingecko():
+    with stage("coingecko", "fetch"):
+        data = fetch_coin_metadata([])
+    record_rows("coingecko", "fetch", len(data))
+    return data
+
+def save_coingecko(data):
     if data:
-        normalize_and_save(data)
+        # Matching happens in SQL as part of the load, so there is no separate parse stage
+        with stage("coingecko", "load"):
+            prices = normalize_and_save(data)
+        record_rows("coingecko", "load", prices)
+
+def ingest_coingecko():
+    save_coingecko(fetch_coingecko())
@@ -1,12 +1,24 @@
+import time
 import requests
 import pandas as pd
 import logging
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from api.db import get_db_connection
+from ingest.rollups import refresh_supply_daily, upsert_current_supply, rebuild_current_supply
+from ingest.metrics import stage, record_rows
+from ingest.http_pool import TokenBucket, make_session, get_json
+from ingest.loader import bulk_load, staged
 
 logger = logging.getLogger(__name__)
 
 DEFILLAMA_STABLECOINS_URL = "https://stablecoins.llama.fi/stablecoins?includePrices=true"
+DEFILLAMA_HISTORY_URL = "https://stablecoins.llama.fi/stablecoin"
+
+# Column order of the rows built by parse_assets() and fetch_history()
+ASSET_COLUMNS = ["asset_id", "symbol", "name", "coingecko_id", "defillama_id", "chain", "category", "last_updated"]
+SUPPLY_COLUMNS = ["timestamp", "asset_id", "chain", "supply", "source", "ingested_at"]
+PRICE_COLUMNS = ["timestamp", "asset_id", "price_usd", "source", "ingested_at"]
 
 def fetch_defillama_data():
     """
@@ -21,16 +33,11 @@ def fetch_defillama_data():
         logger.error(f"Failed to fetch data from DefiLlama: {e}")
         raise
 
-def normalize_and_save(assets):
+def parse_assets(assets, timestamp):
     """
-    Normalizes the DefiLlama data and saves to DuckDB.
-    Updates dim_assets and inserts into fact_supply and fact_prices.
+    Turns the /stablecoins payload into dim_assets, fact_supply and
+    fact_prices rows.
     """
-    conn = get_db_connection()
-    timestamp = datetime.now()
-
-    logger.info(f"Processing {len(assets)} assets from DefiLlama...")
-
     # Lists for bulk insert
     dim_rows = []
     supply_rows = []
@@ -120,51 +127,163 @@ def normalize_and_save(assets):
                 timestamp
             ))
 
-    # Bulk Insert - Dimensions
-    # DuckDB distinct upsert pattern
-    # We will use valid SQL for this.
-    
-    # Create temp table for upsert
-    conn.execute("CREATE TEMP TABLE IF NOT EXISTS staging_dim_assets AS SELECT * FROM dim_assets WHERE 1=0")
-    
-    # DuckDB executemany is efficient
-    conn.executemany("""
-        INSERT INTO dim_assets (asset_id, symbol, name, coingecko_id, defillama_id, chain, category, last_updated)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT (asset_id) DO UPDATE SET 
-            symbol=EXCLUDED.symbol,
-            name=EXCLUDED.name,
-            coingecko_id=EXCLUDED.coingecko_id,
-            last_updated=EXCLUDED.last_updated
-    """, dim_rows)
-
-    # Bulk Insert - Facts
-    # Just append
-    conn.executemany("""
-        INSERT INTO fact_supply (timestamp, asset_id, chain, supply, source, ingested_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, supply_rows)
-
-    conn.executemany("""
-        INSERT INTO fact_prices (timestamp, asset_id, price_usd, source, ingested_at)
-        VALUES (?, ?, ?, ?, ?)
-    """, price_rows)
+    return dim_rows, supply_rows, price_rows
+
+def normalize_and_save(assets):
+    """
+    Normalizes the DefiLlama data and saves to DuckDB.
+    Updates dim_assets and inserts into fact_supply and fact_prices.
+    """
+    save_defillama(parse_defillama(assets))
+
+def parse_defillama(assets):
+    timestamp = datetime.now()
+    logger.info(f"Processing {len(assets)} assets from DefiLlama...")
+
+    with stage("defillama", "parse"):
+        dim_rows, supply_rows, price_rows = parse_assets(assets, timestamp)
+    record_rows("defillama", "parse", len(dim_rows))
+    return timestamp, dim_rows, supply_rows, price_rows
+
+def save_defillama(parsed):
+    """
+    Load stage: writes the rows from parse_defillama().
+    """
+    timestamp, dim_rows, supply_rows, price_rows = parsed
+    conn = get_db_connection()
+
+    with stage("defillama", "load"):
+        # Bulk Insert - Dimensions
+        # DuckDB distinct upsert pattern
+        bulk_load(conn, "dim_assets", dim_rows, ASSET_COLUMNS, sql="""
+            INSERT INTO dim_assets (asset_id, symbol, name, coingecko_id, defillama_id, chain, category, last_updated)
+            SELECT asset_id, symbol, name, coingecko_id, defillama_id, chain, category, last_updated
+            FROM stg_rows
+            ON CONFLICT (asset_id) DO UPDATE SET 
+                symbol=EXCLUDED.symbol,
+                name=EXCLUDED.name,
+                coingecko_id=EXCLUDED.coingecko_id,
+                last_updated=EXCLUDED.last_updated
+        """)
+
+        # Bulk Insert - Facts
+        # Just append
+        bulk_load(conn, "fact_supply", supply_rows, SUPPLY_COLUMNS)
+        bulk_load(conn, "fact_prices", price_rows, PRICE_COLUMNS)
+
+        if supply_rows:
+            refresh_supply_daily(conn, [timestamp])
+            upsert_current_supply(conn, supply_rows)
     
-    conn.commit()
+        conn.commit()
+    record_rows("defillama", "load", len(supply_rows) + len(price_rows))
     conn.close()
     logger.info(f"Ingested {len(supply_rows)} supply records and {len(price_rows)} price records.")
 
+def fetch_defillama():
+    """
+    Fetch and parse stages; touches no database, so it can run alongside
+    other connectors (see run_ingest --parallel).
+    """
+    with stage("defillama", "fetch"):
+        data = fetch_defillama_data()
+    record_rows("defillama", "fetch", len(data))
+    return parse_defillama(data)
+
 def ingest_defillama():
-    data = fetch_defillama_data()
-    normalize_and_save(data)
+    save_defillama(fetch_defillama())
+
+# Backfill defaults; DefiLlama doesn't publish a limit for the
+# stablecoins API, so stay well under what it tolerates
+BACKFILL_WORKERS = 8
+BACKFILL_RATE = 5 # requests per second
+BACKFILL_BATCH_ROWS = 200_000
 
-def backfill_history(limit: int = 10):
+def fetch_history(session, limiter, defillama_id, asset_id, since=None):
     """
-    Backfills historical supply data for the top N stablecoins.
-    Fetches full history from DefiLlama and replaces existing fact_supply entries.
+    Fetches one asset's supply history as fact_supply rows, keeping only
+    points at or after `since` if given. The API always returns the full
+    history; the newest point is re-read because DefiLlama revises it.
     """
-    logger.info(f"Starting backfill for top {limit} assets...")
-    
+    details = get_json(session, f"{DEFILLAMA_HISTORY_URL}/{defillama_id}", limiter)
+    ingested_at = datetime.now()
+    supply_rows = []
+    for point in details.get("tokens", []):
+        ts = point.get("date") # unix timestamp
+        circulating = point.get("circulating", {}).get("peggedUSD")
+
+        if ts and circulating:
+            dt = datetime.fromtimestamp(int(ts))
+            if since is not None and dt < since:
+                continue
+            supply_rows.append((
+                dt,
+                asset_id,
+                "Total",
+                float(circulating),
+                "defillama",
+                ingested_at
+            ))
+    return supply_rows
+
+def write_history_batch(conn, batch):
+    """
+    Upserts the history points of every asset in `batch`
+    ([(asset_id, supply_rows)]) on (timestamp, asset_id, chain, source)
+    with one UPDATE and one anti-join INSERT, then advances the assets'
+    high-water marks. Snapshot rows written by ingest_defillama have
+    their own timestamps and are left alone.
+    Returns the days whose daily rollup needs refreshing.
+    """
+    rows = [row for _, supply_rows in batch for row in supply_rows]
+    start = time.perf_counter()
+    with staged(conn, "backfill_rows", rows, SUPPLY_COLUMNS):
+        updated = conn.execute("""
+            UPDATE fact_supply f
+            SET supply = b.supply, ingested_at = b.ingested_at
+            FROM backfill_rows b
+            WHERE f.timestamp = b.timestamp AND f.asset_id = b.asset_id
+              AND f.chain = b.chain AND f.source = b.source
+              AND f.supply IS DISTINCT FROM b.supply
+        """).fetchone()[0]
+        inserted = conn.execute("""
+            INSERT INTO fact_supply (timestamp, asset_id, chain, supply, source, ingested_at)
+            SELECT b.timestamp, b.asset_id, b.chain, b.supply, b.source, b.ingested_at
+            FROM backfill_rows b
+            ANTI JOIN fact_supply f
+              ON f.timestamp = b.timestamp AND f.asset_id = b.asset_id
+             AND f.chain = b.chain AND f.source = b.source
+        """).fetchone()[0]
+        conn.execute("""
+            INSERT INTO meta_backfill_state (asset_id, source, high_water_mark, updated_at)
+            SELECT asset_id, 'defillama', max(timestamp), now()
+            FROM backfill_rows
+            GROUP BY asset_id
+            ON CONFLICT (asset_id, source) DO UPDATE SET
+                high_water_mark = EXCLUDED.high_water_mark,
+                updated_at = EXCLUDED.updated_at
+        """)
+        touched_days = {r[0] for r in conn.execute("SELECT DISTINCT date_trunc('day', timestamp) FROM backfill_rows").fetchall()}
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Upserted history for {len(batch)} assets: {inserted} new points, {updated} revised "
+        f"({len(rows) / elapsed:,.0f} rows/s)."
+    )
+    return touched_days, inserted + updated
+
+def backfill_history(limit=None, workers=BACKFILL_WORKERS, rate=BACKFILL_RATE, batch_rows=BACKFILL_BATCH_ROWS, full=False):
+    """
+    Backfills historical supply data for the top `limit` stablecoins (all
+    of them by default). Only points from each asset's high-water mark
+    (meta_backfill_state) onwards are written, unless `full` is set, in
+    which case the whole history is re-upserted.
+
+    Histories are fetched by `workers` threads sharing one keep-alive
+    session, throttled to `rate` requests/second with retries. Writes are
+    collected across assets and flushed every `batch_rows` rows.
+    """
+    logger.info(f"Starting backfill for {f'top {limit}' if limit else 'all'} assets...")
+
     # 1. Get Top Assets from DefiLlama
     data = fetch_defillama_data()
     # Sort by circulating (desc)
@@ -174,66 +293,77 @@ def backfill_history(limit: int = 10):
         if isinstance(val, dict):
             return val.get("peggedUSD", 0)
         return val or 0
-        
+
     data.sort(key=get_circ, reverse=True)
-    top_assets = data[:limit]
-    
+    top_assets = data[:limit] if limit else data
+
     conn = get_db_connection()
+    session = make_session(workers)
+    limiter = TokenBucket(rate, burst=workers)
+    touched_days = set()
+    touched_assets = set()
+    failed = []
+    written = 0
     try:
-        for asset in top_assets:
-            symbol = asset.get("symbol")
-            defillama_id = asset.get("id")
-            
-            # Find internal asset_id
-            # We assume ingestion has run at least once so dim_assets exists
-            row = conn.execute("SELECT asset_id FROM dim_assets WHERE defillama_id = ?", [str(defillama_id)]).fetchone()
-            if not row:
-                logger.warning(f"Asset {symbol} (DL ID: {defillama_id}) not found in dim_assets. Skipping backfill.")
-                continue
-            
-            asset_id = row[0]
-            logger.info(f"Backfilling {symbol} ({asset_id})...")
-            
-            # Fetch History
-            url = f"https://stablecoins.llama.fi/stablecoin/{defillama_id}"
-            try:
-                res = requests.get(url, timeout=30)
-                res.raise_for_status()
-                details = res.json()
-            except Exception as e:
-                logger.error(f"Failed to fetch history for {symbol}: {e}")
-                continue
-                
-            history_points = details.get("tokens", [])
-            supply_rows = []
-            
-            for point in history_points:
-                ts = point.get("date") # unix timestamp
-                circulating = point.get("circulating", {}).get("peggedUSD")
-                
-                if ts and circulating:
-                    dt = datetime.fromtimestamp(ts)
-                    supply_rows.append((
-                        dt,
-                        asset_id,
-                        "Total",
-                        float(circulating),
-                        "defillama",
-                        datetime.now()
-                    ))
-            
-            if supply_rows:
-                # DELETE existing entries for this asset to verify clean history
-                conn.execute("DELETE FROM fact_supply WHERE asset_id = ? AND source = 'defillama'", [asset_id])
-                
-                # Bulk Insert
-                conn.executemany("""
-                    INSERT INTO fact_supply (timestamp, asset_id, chain, supply, source, ingested_at)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, supply_rows)
-                
-                logger.info(f"Inserted {len(supply_rows)} historical points for {symbol}.")
-                
+        # We assume ingestion has run at least once so dim_assets exists
+        known = dict(conn.execute("SELECT defillama_id, asset_id FROM dim_assets WHERE defillama_id IS NOT NULL").fetchall())
+        marks = {} if full else dict(conn.execute(
+            "SELECT asset_id, high_water_mark FROM meta_backfill_state WHERE source = 'defillama'"
+        ).fetchall())
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="backfill") as pool:
+            futures = {}
+            for asset in top_assets:
+                symbol = asset.get("symbol")
+                defillama_id = str(asset.get("id"))
+                asset_id = known.get(defillama_id)
+                if asset_id is None:
+                    logger.warning(f"Asset {symbol} (DL ID: {defillama_id}) not found in dim_assets. Skipping backfill.")
+                    continue
+                since = marks.get(asset_id)
+                futures[pool.submit(fetch_history, session, limiter, defillama_id, asset_id, since)] = (symbol, asset_id)
+
+            mode = "full" if full else f"incremental, {len(marks)} assets with a high-water mark"
+            logger.info(f"Fetching history for {len(futures)} assets ({mode}) with {workers} workers at {rate} req/s...")
+            batch = []
+            pending = 0
+            for future in as_completed(futures):
+                symbol, asset_id = futures[future]
+                try:
+                    supply_rows = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to fetch history for {symbol}: {e}")
+                    failed.append(symbol)
+                    continue
+                if not supply_rows:
+                    continue
+
+                batch.append((asset_id, supply_rows))
+                pending += len(supply_rows)
+                if pending >= batch_rows:
+                    days, changed = write_history_batch(conn, batch)
+                    touched_days.update(days)
+                    touched_assets.update(a for a, _ in batch)
+                    written += changed
+                    batch = []
+                    pending = 0
+
+            if batch:
+                days, changed = write_history_batch(conn, batch)
+                touched_days.update(days)
+                touched_assets.update(a for a, _ in batch)
+                written += changed
+
+        days = refresh_supply_daily(conn, touched_days)
+        logger.info(f"Refreshed agg_supply_daily for {days} days.")
+        rebuild_current_supply(conn, touched_assets)
+
         conn.commit()
     finally:
+        session.close()
         conn.close()
+
+    logger.info(f"Backfill wrote {written} points for {len(touched_assets)} assets; {len(failed)} failed.")
+    if failed:
+        logger.warning(f"Failed assets: {', '.join(str(s) for s in failed)}")
+    return written
@@ -14,6 +14,8 @@ import logging
 import urllib.parse
 from datetime import datetime
 from api.db import get_db_connection
+from ingest.metrics import stage, record_rows
+from ingest.loader import bulk_load
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +42,8 @@ def fetch_cryptoscamdb():
         logger.error(f"Failed to fetch CryptoScamDB: {e}")
         return []
 
+SOURCE_REF = "CryptoScamDB"
+
 def normalize_and_save(data):
     """
     Data is a list of dicts:
@@ -49,19 +53,20 @@ def normalize_and_save(data):
         ETH: [0x..., 0x...]
         BTC: [1...]
     """
-    conn = get_db_connection()
-    timestamp = datetime.now()
-    source_ref = "CryptoScamDB"
-    
     if not isinstance(data, list):
          logger.warning("CryptoScamDB response was not a list.")
          return
-    
+    return save_entries(parse_entries(data))
+
+def parse_entries(data):
+    """
+    Flattens the YAML entries into address rows and {entity_id: (name, category)}.
+    """
+    timestamp = datetime.now()
+    source_ref = SOURCE_REF
+
     logger.info(f"Processing {len(data)} entries from CryptoScamDB...")
 
-    # Clean up old
-    conn.execute("DELETE FROM fact_sanctioned_addresses WHERE source_ref = ?", [source_ref])
-    
     rows = []
     entities = {}
 
@@ -101,12 +106,18 @@ def normalize_and_save(data):
                     source_ref
                 ))
 
+    return timestamp, rows, entities
+
+def save_entries(parsed):
+    timestamp, rows, entities = parsed
+    conn = get_db_connection()
+
+    # Clean up old
+    conn.execute("DELETE FROM fact_sanctioned_addresses WHERE source_ref = ?", [SOURCE_REF])
+
     # Insert Entities
-    unique_ents = list(entities.items())
-    conn.execute("CREATE TEMP TABLE IF NOT EXISTS temp_csdb_ents (entity_id VARCHAR, name VARCHAR, program VARCHAR)")
-    conn.executemany("INSERT INTO temp_csdb_ents VALUES (?, ?, ?)", [(k, v[0], v[1]) for k, v in unique_ents])
-    
-    conn.execute("""
+    unique_ents = [(k, v[0], v[1]) for k, v in entities.items()]
+    bulk_load(conn, "dim_sanctions_entity", unique_ents, ["entity_id", "name", "program"], name="temp_csdb_ents", params=[timestamp], sql="""
         INSERT INTO dim_sanctions_entity (entity_id, name, program, authority, source_url, last_updated, opencorporates_search_url)
         SELECT 
             entity_id, 
@@ -118,25 +129,41 @@ def normalize_and_save(data):
             'https://opencorporates.com/companies?q=' || replace(name, ' ', '+')
         FROM temp_csdb_ents
         WHERE entity_id NOT IN (SELECT entity_id FROM dim_sanctions_entity)
-    """, [timestamp])
-    
-    conn.execute("DROP TABLE temp_csdb_ents")
+    """)
 
     # Insert Addresses
-    if rows:
-        chunk_size = 5000
-        for i in range(0, len(rows), chunk_size):
-            chunk = rows[i:i+chunk_size]
-            conn.executemany("""
-                INSERT INTO fact_sanctioned_addresses (address, chain, entity_id, listed_date, confidence_score, source_ref)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, chunk)
+    bulk_load(conn, "fact_sanctioned_addresses", rows,
+              ["address", "chain", "entity_id", "listed_date", "confidence_score", "source_ref"])
     
     conn.commit()
     conn.close()
     logger.info(f"CryptoScamDB ingest complete. Ingested {len(rows)} addresses.")
+    return len(rows)
+
+def fetch_and_parse_cryptoscamdb():
+    """
+    Fetch and parse stages; returns the parsed rows, or None if there is
+    nothing to load.
+    """
+    # The YAML is parsed as part of the fetch
+    with stage("cryptoscamdb", "fetch"):
+        data = fetch_cryptoscamdb()
+    record_rows("cryptoscamdb", "fetch", len(data or []))
+    if not data:
+        return None
+    if not isinstance(data, list):
+         logger.warning("CryptoScamDB response was not a list.")
+         return None
+    with stage("cryptoscamdb", "parse"):
+        parsed = parse_entries(data)
+    record_rows("cryptoscamdb", "parse", len(parsed[1]))
+    return parsed
+
+def save_cryptoscamdb(parsed):
+    if parsed is not None:
+        with stage("cryptoscamdb", "load"):
+            rows = save_entries(parsed)
+        record_rows("cryptoscamdb", "load", rows)
 
 def ingest_cryptoscamdb():
-    data = fetch_cryptoscamdb()
-    if data:
-        normalize_and_save(data)
+    save_cryptoscamdb(fetch_and_parse_cryptoscamdb())
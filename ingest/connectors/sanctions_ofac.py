@@ -5,6 +5,8 @@ import logging
 import urllib.parse
 from datetime import datetime
 from api.db import get_db_connection
+from ingest.metrics import stage, record_rows
+from ingest.loader import bulk_load
 
 logger = logging.getLogger(__name__)
 
@@ -26,70 +28,64 @@ def fetch_ofac_sdn():
         logger.error(f"Failed to fetch OFAC SDN: {e}.")
         raise e
 
+SDN_COLUMNS = ["ent_num", "SDN_Name", "SDN_Type", "Program", "Title", "Call_Sign",
+               "Vess_type", "Tonnage", "GRT", "Vess_flag", "Vess_owner", "Remarks"]
+
+# "Digital Currency Address - XBT 1Abc...;", optionally prefixed "alt."
+ADDRESS_PATTERN = r"Digital Currency Address\s*-?\s*(?P<currency>\S+)\s+(?P<address>[^\s;]+)"
+
+# SDN currency codes to chains; other codes are kept as the chain name
+CURRENCY_CHAINS = {
+    "XBT": "Bitcoin",
+    "ETH": "Ethereum",
+    "TRX": "Tron",
+    "LTC": "Litecoin",
+    "XMR": "Monero",
+    "USDC": "Ethereum",
+    "USDT": "Ethereum",
+}
+
+RECORD_COLUMNS = ["address", "chain", "entity_id", "entity_name", "program", "source"]
+
 def parse_crypto_addresses(content):
-    cols = ["ent_num", "SDN_Name", "SDN_Type", "Program", "Title", "Call_Sign", 
-            "Vess_type", "Tonnage", "GRT", "Vess_flag", "Vess_owner", "Remarks"]
-            
+    """
+    Extracts every digital currency address from the SDN CSV with one
+    vectorized regex pass over the Remarks column. Returns a DataFrame
+    with RECORD_COLUMNS.
+    """
     try:
-        df = pd.read_csv(io.BytesIO(content), names=cols, on_bad_lines='skip', dtype=str)
+        df = pd.read_csv(io.BytesIO(content), names=SDN_COLUMNS, on_bad_lines='skip', dtype=str)
     except Exception as e:
         logger.error(f"Failed to parse CSV: {e}")
-        return []
+        return pd.DataFrame(columns=RECORD_COLUMNS)
 
     df = df.fillna("")
-    crypto_df = df[df['Remarks'].str.contains("Digital Currency Address", na=False, case=False)]
-    
-    results = []
-    
-    for _, row in crypto_df.iterrows():
-        remarks = row['Remarks']
-        entity_name = row['SDN_Name']
-        program = row['Program']
-        ent_id = str(row['ent_num'])
-        
-        if not program or str(program).lower() == 'nan':
-            program = "Unspecified"
-            
-        parts = remarks.split(';')
-        for part in parts:
-            if "Digital Currency Address" in part:
-                 # Clean up "alt." artifacts and other noise
-                 clean = part.replace("Digital Currency Address", "").replace("alt.", "").strip()
-                 
-                 if clean.startswith("-"):
-                     clean = clean[1:].strip()
-                 
-                 subparts = clean.split()
-                 if len(subparts) >= 2:
-                     curr = subparts[0].upper()
-                     addr = subparts[1]
-                     
-                     # Validation heuristic
-                     if len(addr) < 10: 
-                         continue
-
-                     chain = "Unknown"
-                     if curr == "XBT": chain = "Bitcoin"
-                     elif curr == "ETH": chain = "Ethereum"
-                     elif curr == "TRX": chain = "Tron"
-                     elif curr == "LTC": chain = "Litecoin"
-                     elif curr == "XMR": chain = "Monero"
-                     elif curr == "USDC": chain = "Ethereum" 
-                     elif curr == "USDT": chain = "Ethereum"
-                     else: chain = curr
-                     
-                     results.append({
-                         "address": addr,
-                         "chain": chain,
-                         "entity_id": ent_id,
-                         "entity_name": entity_name,
-                         "program": program,
-                         "source": "OFAC SDN"
-                     })
-                     
-    return results
+    crypto_df = df[df['Remarks'].str.contains("Digital Currency Address", regex=False)]
+
+    # One row per address, indexed by (SDN row, match number)
+    matches = crypto_df['Remarks'].str.extractall(ADDRESS_PATTERN)
+    # Validation heuristic
+    matches = matches[matches['address'].str.len() >= 10]
+    matches = matches.join(crypto_df[['ent_num', 'SDN_Name', 'Program']], on=matches.index.get_level_values(0))
+
+    currency = matches['currency'].str.upper()
+    program = matches['Program'].where((matches['Program'] != "") & (matches['Program'].str.lower() != "nan"), "Unspecified")
+
+    return pd.DataFrame({
+        "address": matches['address'],
+        "chain": currency.map(CURRENCY_CHAINS).fillna(currency),
+        "entity_id": matches['ent_num'],
+        "entity_name": matches['SDN_Name'],
+        "program": program,
+        "source": "OFAC SDN",
+    }).reset_index(drop=True)
 
 def normalize_and_save(records):
+    """
+    Replaces the OFAC addresses and merges their entities in two bulk
+    statements: new entities are inserted, existing ones only get
+    last_updated bumped.
+    """
     conn = get_db_connection()
     timestamp = datetime.now()
     
@@ -101,45 +97,48 @@ def normalize_and_save(records):
         logger.debug(f"Column source_ref might already exist: {e}")
 
     conn.execute("DELETE FROM fact_sanctioned_addresses WHERE source_ref = 'OFAC SDN'")
-    
-    entities = {}
-    for r in records:
-        entities[r['entity_id']] = (r['entity_name'], r['program'])
-        
-    for ent_id, (name, prog) in entities.items():
-        existing = conn.execute("SELECT 1 FROM dim_sanctions_entity WHERE entity_id = ?", [ent_id]).fetchone()
-        if existing:
-             conn.execute("UPDATE dim_sanctions_entity SET last_updated = ? WHERE entity_id = ?", [timestamp, ent_id])
-        else:
-             search_url = f"https://opencorporates.com/companies?q={urllib.parse.quote_plus(name)}"
-             conn.execute("""
-                INSERT INTO dim_sanctions_entity (entity_id, name, program, authority, source_url, last_updated, opencorporates_search_url)
-                VALUES (?, ?, ?, 'OFAC', ?, ?, ?)
-             """, [ent_id, name, prog, OFAC_SDN_URL, timestamp, search_url])
-
-    rows = []
-    for r in records:
-        rows.append((
-            r['address'],
-            r['chain'],
-            r['entity_id'],
-            timestamp,
-            1.0, 
-            "OFAC SDN"
-        ))
-        
-    if rows:
-        conn.executemany("""
-            INSERT INTO fact_sanctioned_addresses (address, chain, entity_id, listed_date, confidence_score, source_ref)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, rows)
+
+    entities = records.drop_duplicates("entity_id", keep="last")[["entity_id", "entity_name", "program"]]
+    entities = entities.assign(search_url=
+        "https://opencorporates.com/companies?q=" + entities["entity_name"].map(urllib.parse.quote_plus)
+    )
+    # INSERT ... ON CONFLICT rather than MERGE, which needs DuckDB 1.4
+    bulk_load(conn, "dim_sanctions_entity", entities, None, params=[OFAC_SDN_URL, timestamp], sql="""
+        INSERT INTO dim_sanctions_entity (entity_id, name, program, authority, source_url, last_updated, opencorporates_search_url)
+        SELECT entity_id, entity_name, program, 'OFAC', ?, ?, search_url
+        FROM stg_rows
+        ON CONFLICT (entity_id) DO UPDATE SET last_updated = EXCLUDED.last_updated
+    """)
+
+    bulk_load(conn, "fact_sanctioned_addresses", records[["address", "chain", "entity_id"]], None, params=[timestamp], sql="""
+        INSERT INTO fact_sanctioned_addresses (address, chain, entity_id, listed_date, confidence_score, source_ref)
+        SELECT address, chain, entity_id, ?, 1.0, 'OFAC SDN'
+        FROM stg_rows
+    """)
     
     conn.commit()
     conn.close()
     logger.info("OFAC ingest complete.")
 
-def ingest_ofac():
-    content = fetch_ofac_sdn()
-    if content:
+def fetch_ofac():
+    """
+    Fetch and parse stages; returns the address records, or None if the
+    download was empty.
+    """
+    with stage("ofac", "fetch"):
+        content = fetch_ofac_sdn()
+    if not content:
+        return None
+    with stage("ofac", "parse"):
         records = parse_crypto_addresses(content)
-        normalize_and_save(records)
+    record_rows("ofac", "parse", len(records))
+    return records
+
+def save_ofac(records):
+    if records is not None:
+        with stage("ofac", "load"):
+            normalize_and_save(records)
+        record_rows("ofac", "load", len(records))
+
+def ingest_ofac():
+    save_ofac(fetch_ofac())
@@ -1,182 +1,413 @@
+import os
+import re
 import requests
-import json
+import orjson
 import logging
+import tempfile
 import urllib.parse
+import multiprocessing
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 from api.db import get_db_connection
+from ingest.metrics import stage, record_rows
+from ingest.loader import bulk_load
 
 logger = logging.getLogger(__name__)
 
 # Filtered dataset (Sanctions only, no PEPs)
 OPENSANCTIONS_URL = "https://data.opensanctions.org/datasets/latest/sanctions/entities.ftm.json"
 
-def fetch_and_load_opensanctions():
+ENTITY_SCHEMAS = ["Person", "Company", "Organization", "LegalEntity", "Vessel", "Aircraft"]
+
+# Parse settings: the download is split into newline-aligned ranges of
+# PARSE_CHUNK_BYTES, decoded by PARSE_WORKERS processes. Smaller files
+# are parsed in-process.
+PARSE_WORKERS = os.cpu_count() or 1
+PARSE_CHUNK_BYTES = 16 * 1024 * 1024
+
+# Top-level keys, read from the raw line before any JSON decoding.
+# Quotes inside property values are escaped, so these can't match there.
+SCHEMA_PATTERN = re.compile(rb'"schema":\s*"(\w+)"')
+ID_PATTERN = re.compile(rb'"id":\s*"([^"]*)"')
+ENTITY_SCHEMA_BYTES = {s.encode() for s in ENTITY_SCHEMAS}
+
+def parse_line(line, entity_rows, wallet_rows):
+    """
+    Appends the entity and wallet rows found in one FtM JSON line.
+    """
+    data = orjson.loads(line)
+    schema = data.get("schema")
+    props = data.get("properties", {})
+
+    ent_id = data.get("id")
+
+    # EXTRACT ENTITY DATA
+    # We store basically everyone just in case they are a holder
+    # Metadata: Name
+    name = data.get("caption") or props.get("name", [None])[0]
+    if not name and "name" in props:
+         name = props["name"][0]
+
+    # Authority: extracted from 'datasets'
+    # data['datasets'] is a list like ['us_ofac_sdn', 'sanctions']
+    # We pick the most specific one that isn't 'sanctions' or 'default'
+    datasets = data.get("datasets", [])
+    authority = "OpenSanctions"
+    for d in datasets:
+        if d not in ["sanctions", "default", "openanctions"]:
+            authority = d
+            break
+
+    last_change = data.get("last_change")
+
+    if schema in ENTITY_SCHEMAS:
+        entity_rows.append((ent_id, name, authority, last_change))
+
+    # EXTRACT WALLET DATA
+    if schema == "CryptoWallet":
+        # address mapping
+        public_keys = props.get("publicKey", [])
+        currencies = props.get("currency", [])
+        holders = props.get("holder", [])
+
+        # Flatten: 1 wallet entity might have multiple keys/currencies (rare)
+        # usually 1:1, but holder might be multiple
+
+        for pk in public_keys:
+            curr = currencies[0] if currencies else "Unknown"
+
+            if not holders:
+                # Orphan wallet? Skip or log?
+                # Sometimes mapped via opposite edge?
+                # For now, skip if no holder (can't link to sanction)
+                continue
+
+            for holder in holders:
+                wallet_rows.append((ent_id, pk, curr, holder, last_change))
+
+def read_http_state(url):
+    """
+    Validators (etag, last_modified, content_length) saved for `url` by
+    the last successful load, or None.
+    """
     conn = get_db_connection()
-    timestamp = datetime.now()
-    
-    logger.info("Starting OpenSanctions ingest (Stream -> Staging)...")
-    
-    # 1. Create Staging Tables
-    conn.execute("CREATE OR REPLACE TEMP TABLE stg_os_entities (id VARCHAR, name VARCHAR, authority VARCHAR, last_change TIMESTAMP)")
-    conn.execute("CREATE OR REPLACE TEMP TABLE stg_os_wallets (address VARCHAR, currency VARCHAR, holder_id VARCHAR)")
-    
-    # 2. Stream and Buffer
-    # We'll batch inserts for performance
-    entity_batch = []
-    wallet_batch = []
-    batch_size = 5000
-    
     try:
-        with requests.get(OPENSANCTIONS_URL, stream=True, timeout=120) as r:
+        return conn.execute(
+            "SELECT etag, last_modified, content_length FROM meta_http_state WHERE url = ?", [url]
+        ).fetchone()
+    finally:
+        conn.close()
+
+def _lines(path, start, end):
+    with open(path, "rb") as f:
+        f.seek(start)
+        for line in f.read(end - start).splitlines():
+            if line:
+                yield line
+
+def parse_wallet_range(path, start, end):
+    """
+    First pass: wallet rows from the CryptoWallet records in a byte range.
+    """
+    wallet_rows = []
+    for line in _lines(path, start, end):
+        match = SCHEMA_PATTERN.search(line)
+        if match is None or match.group(1) != b"CryptoWallet":
+            continue
+        try:
+            parse_line(line, [], wallet_rows)
+        except Exception as e:
+            # Malformed line?
+            continue
+    return wallet_rows
+
+def parse_holder_range(path, start, end, holders):
+    """
+    Second pass: entity rows for the wallet holders in a byte range.
+    Only lines whose schema and id pass the byte-level check are decoded.
+    """
+    entity_rows = []
+    for line in _lines(path, start, end):
+        match = SCHEMA_PATTERN.search(line)
+        if match is None or match.group(1) not in ENTITY_SCHEMA_BYTES:
+            continue
+        match = ID_PATTERN.search(line)
+        if match is None or match.group(1).decode() not in holders:
+            continue
+        try:
+            parse_line(line, entity_rows, [])
+        except Exception as e:
+            continue
+    return entity_rows
+
+def chunk_ranges(path, chunk_bytes=PARSE_CHUNK_BYTES):
+    """
+    Splits an NDJSON file into (start, end) byte ranges of about
+    `chunk_bytes`, each ending on a line boundary.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+def parse_dump(path, workers=PARSE_WORKERS, chunk_bytes=PARSE_CHUNK_BYTES):
+    """
+    Parses a downloaded FtM dump into (entity rows, wallet rows) in two
+    passes over byte ranges: wallets first, then only their holders.
+    Workers read their own ranges from disk and return filtered rows, so
+    memory stays bounded by the chunks in flight rather than the file.
+    """
+    ranges = chunk_ranges(path, chunk_bytes)
+    if workers <= 1 or len(ranges) <= 1:
+        wallet_rows = [row for start, end in ranges for row in parse_wallet_range(path, start, end)]
+        holders = {w[3] for w in wallet_rows}
+        entity_rows = [row for start, end in ranges for row in parse_holder_range(path, start, end, holders)]
+        return entity_rows, wallet_rows
+
+    # spawn rather than fork: ingest --parallel calls this from a thread
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=context) as pool:
+        paths = [path] * len(ranges)
+        starts = [start for start, _ in ranges]
+        ends = [end for _, end in ranges]
+        wallet_rows = [row for rows in pool.map(parse_wallet_range, paths, starts, ends) for row in rows]
+        holders = frozenset(w[3] for w in wallet_rows)
+        entity_rows = [
+            row for rows in pool.map(parse_holder_range, paths, starts, ends, [holders] * len(ranges))
+            for row in rows
+        ]
+    return entity_rows, wallet_rows
+
+def fetch_opensanctions():
+    """
+    Fetch and parse stages: downloads the dataset to a temporary file and
+    returns (validators, entity rows, wallet rows) without writing to the
+    database. Only wallets and the entities holding them are kept, since
+    nothing else is loaded. Returns None when the server reports the
+    dataset unchanged since the last load (conditional GET).
+    """
+    headers = {}
+    state = read_http_state(OPENSANCTIONS_URL)
+    if state:
+        etag, last_modified, _ = state
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    logger.info("Starting OpenSanctions ingest (Download -> Parse)...")
+
+    fd, path = tempfile.mkstemp(suffix=".ftm.json", prefix="opensanctions-")
+    try:
+        received = 0
+        with stage("opensanctions", "fetch"), os.fdopen(fd, "wb") as out, \
+                requests.get(OPENSANCTIONS_URL, headers=headers, stream=True, timeout=120) as r:
+            if r.status_code == 304:
+                logger.info(f"OpenSanctions dataset unchanged; skipped downloading {state[2] or 0} bytes.")
+                record_rows("opensanctions", "fetch", 0)
+                return None
             r.raise_for_status()
-            
-            for line in r.iter_lines():
-                if not line: continue
-                try:
-                    data = json.loads(line)
-                    schema = data.get("schema")
-                    props = data.get("properties", {})
-                    
-                    ent_id = data.get("id")
-                    
-                    # EXTRACT ENTITY DATA
-                    # We store basically everyone just in case they are a holder
-                    # Metadata: Name
-                    name = data.get("caption") or props.get("name", [None])[0]
-                    if not name and "name" in props:
-                         name = props["name"][0]
-                    
-                    # Authority: extracted from 'datasets'
-                    # data['datasets'] is a list like ['us_ofac_sdn', 'sanctions']
-                    # We pick the most specific one that isn't 'sanctions' or 'default'
-                    datasets = data.get("datasets", [])
-                    authority = "OpenSanctions"
-                    for d in datasets:
-                        if d not in ["sanctions", "default", "openanctions"]:
-                            authority = d
-                            break
-                    
-                    last_change = data.get("last_change")
-                    
-                    if schema in ["Person", "Company", "Organization", "LegalEntity", "Vessel", "Aircraft"]:
-                        entity_batch.append((ent_id, name, authority, last_change))
-                    
-                    # EXTRACT WALLET DATA
-                    if schema == "CryptoWallet":
-                        # address mapping
-                        public_keys = props.get("publicKey", [])
-                        currencies = props.get("currency", [])
-                        holders = props.get("holder", [])
-                        
-                        # Flatten: 1 wallet entity might have multiple keys/currencies (rare)
-                        # usually 1:1, but holder might be multiple
-                        
-                        for pk in public_keys:
-                            curr = currencies[0] if currencies else "Unknown"
-                            
-                            if not holders:
-                                # Orphan wallet? Skip or log?
-                                # Sometimes mapped via opposite edge? 
-                                # For now, skip if no holder (can't link to sanction)
-                                continue
-                                
-                            for holder in holders:
-                                wallet_batch.append((pk, curr, holder))
-                                
-                    # Flush Batches
-                    if len(entity_batch) >= batch_size:
-                        conn.executemany("INSERT INTO stg_os_entities VALUES (?, ?, ?, ?)", entity_batch)
-                        entity_batch = []
-                        
-                    if len(wallet_batch) >= batch_size:
-                        conn.executemany("INSERT INTO stg_os_wallets VALUES (?, ?, ?)", wallet_batch)
-                        wallet_batch = []
-                        
-                except Exception as e:
-                    # Malformed line?
-                    continue
-                    
-        # Flush remaining
-        if entity_batch:
-            conn.executemany("INSERT INTO stg_os_entities VALUES (?, ?, ?, ?)", entity_batch)
-        if wallet_batch:
-            conn.executemany("INSERT INTO stg_os_wallets VALUES (?, ?, ?)", wallet_batch)
-            
-        logger.info("Staging complete. Normalizing to final tables...")
-        
-        # 3. Normalize to Final Tables
-        
-        # We only care about entities that ARE holders of a wallet
-        # JOIN stg_os_wallets -> stg_os_entities
-        
-        # Insert/Update Authorities (Entities)
-        # Note: We prefix IDs with 'OS-' to avoid collision with OFAC- (though OFAC IDs are usually integers)
-        # Actually OpenSanctions IDs are unique strings. We can use them directly or prefix.
-        # Let's prefix for safety: "OS-<id>"
-        
-        # Update/Insert Dim Entities
-        # We construct the OC Search URL
-        conn.execute("""
-            INSERT INTO dim_sanctions_entity (entity_id, name, program, authority, source_url, last_updated, opencorporates_search_url)
-            SELECT DISTINCT 
-                'OS-' || e.id, 
-                e.name, 
-                'OpenSanctions Consolidated', 
-                e.authority, 
-                'https://opensanctions.org/entities/' || e.id, 
-                CAST(e.last_change as TIMESTAMP),
-                'https://opencorporates.com/companies?q=' || replace(e.name, ' ', '+')
-            FROM stg_os_entities e
-            JOIN stg_os_wallets w ON e.id = w.holder_id
-            WHERE 'OS-' || e.id NOT IN (SELECT entity_id FROM dim_sanctions_entity)
-        """)
-        
-        # Insert Facts (Addresses)
-        # Filter duplicates based on address+chain? 
-        # Or simple clear and reload for this source?
-        # OpenSanctions is aggressive, might duplicate OFAC.
-        # IF we use this, we might want to DISABLE the standalone 'sanctions_ofac' connector 
-        # OR handle duplicates.
-        # Strategy: distinct source_ref = 'OpenSanctions'.
-        
-        count_before = conn.execute("SELECT count(*) FROM fact_sanctioned_addresses WHERE source_ref = 'OpenSanctions'").fetchone()[0]
-        conn.execute("DELETE FROM fact_sanctioned_addresses WHERE source_ref = 'OpenSanctions'")
-        
-        conn.execute(f"""
-            INSERT INTO fact_sanctioned_addresses (address, chain, entity_id, listed_date, confidence_score, source_ref)
-            SELECT DISTINCT
-                w.address,
-                w.currency,
-                'OS-' || w.holder_id,
-                '{timestamp}'::TIMESTAMP,
-                1.0,
-                'OpenSanctions'
-            FROM stg_os_wallets w
-            JOIN stg_os_entities e ON w.holder_id = e.id
-        """)
-        
-        count_after = conn.execute("SELECT count(*) FROM fact_sanctioned_addresses WHERE source_ref = 'OpenSanctions'").fetchone()[0]
-        
-        logger.info(f"OpenSanctions Import Summary: {count_after} addresses (Prev: {count_before}).")
-        
+
+            for block in r.iter_content(chunk_size=1024 * 1024):
+                out.write(block)
+                received += len(block)
+
+            validators = (r.headers.get("ETag"), r.headers.get("Last-Modified"), received)
+        logger.info(f"Downloaded {received} bytes from OpenSanctions.")
+
+        with stage("opensanctions", "parse"):
+            entity_rows, wallet_rows = parse_dump(path)
+        record_rows("opensanctions", "parse", len(entity_rows) + len(wallet_rows))
+    finally:
+        os.remove(path)
+
+    return validators, entity_rows, wallet_rows
+
+def load_opensanctions(parsed):
+    """
+    Load stage: applies the entities and wallets that were added, changed
+    (by `last_change`) or removed since the last load, using the records
+    kept in src_opensanctions_*. Returns False if nothing changed.
+    """
+    if parsed is None:
+        return False
+    validators, entity_rows, wallet_rows = parsed
+    conn = get_db_connection()
+    timestamp = datetime.now()
+
+    try:
+        with stage("opensanctions", "load"):
+            # 1. Create Staging Tables
+            conn.execute("CREATE OR REPLACE TEMP TABLE stg_os_entities (id VARCHAR, name VARCHAR, authority VARCHAR, last_change TIMESTAMP)")
+            conn.execute("CREATE OR REPLACE TEMP TABLE stg_os_wallets (wallet_id VARCHAR, address VARCHAR, currency VARCHAR, holder_id VARCHAR, last_change TIMESTAMP)")
+
+            bulk_load(conn, "stg_os_entities", entity_rows, ["id", "name", "authority", "last_change"])
+            bulk_load(conn, "stg_os_wallets", wallet_rows, ["wallet_id", "address", "currency", "holder_id", "last_change"])
+
+            logger.info("Staging complete. Computing changes since the last load...")
+
+            # Addresses loaded before delta tracking existed aren't in
+            # src_opensanctions_wallets, so the first run replaces them all
+            if conn.execute("SELECT count(*) FROM src_opensanctions_wallets").fetchone()[0] == 0:
+                conn.execute("DELETE FROM fact_sanctioned_addresses WHERE source_ref = 'OpenSanctions'")
+
+            # 2. Work out the delta
+            # Entities and wallets are compared by id and last_change
+            conn.execute("""
+                CREATE OR REPLACE TEMP TABLE os_changed_entities AS
+                SELECT id FROM stg_os_entities n
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM src_opensanctions_entities s
+                    WHERE s.id = n.id AND s.last_change IS NOT DISTINCT FROM n.last_change
+                )
+            """)
+            conn.execute("""
+                CREATE OR REPLACE TEMP TABLE os_removed_entities AS
+                SELECT id FROM src_opensanctions_entities
+                WHERE id NOT IN (SELECT id FROM stg_os_entities)
+            """)
+            conn.execute("""
+                CREATE OR REPLACE TEMP TABLE os_changed_wallets AS
+                SELECT DISTINCT wallet_id FROM stg_os_wallets n
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM src_opensanctions_wallets s
+                    WHERE s.wallet_id = n.wallet_id AND s.last_change IS NOT DISTINCT FROM n.last_change
+                )
+                UNION
+                SELECT DISTINCT wallet_id FROM src_opensanctions_wallets
+                WHERE wallet_id NOT IN (SELECT wallet_id FROM stg_os_wallets)
+            """)
+            changed_entities, removed_entities, changed_wallets = conn.execute("""
+                SELECT
+                    (SELECT count(*) FROM os_changed_entities),
+                    (SELECT count(*) FROM os_removed_entities),
+                    (SELECT count(*) FROM os_changed_wallets)
+            """).fetchone()
+            skipped = len(entity_rows) - changed_entities + conn.execute(
+                "SELECT count(DISTINCT wallet_id) FROM stg_os_wallets WHERE wallet_id NOT IN (SELECT wallet_id FROM os_changed_wallets)"
+            ).fetchone()[0]
+
+            # 3. Apply it
+            # Note: We prefix IDs with 'OS-' to avoid collision with OFAC- (though OFAC IDs are usually integers)
+
+            # Addresses of changed or removed wallets, and of holders that are gone
+            conn.execute("""
+                DELETE FROM fact_sanctioned_addresses
+                WHERE source_ref = 'OpenSanctions'
+                  AND (
+                    entity_id IN (SELECT 'OS-' || id FROM os_removed_entities)
+                    OR EXISTS (
+                        SELECT 1 FROM src_opensanctions_wallets s
+                        WHERE s.wallet_id IN (SELECT wallet_id FROM os_changed_wallets)
+                          AND s.address = fact_sanctioned_addresses.address
+                          AND 'OS-' || s.holder_id = fact_sanctioned_addresses.entity_id
+                    )
+                  )
+            """)
+
+            conn.execute("DELETE FROM src_opensanctions_wallets WHERE wallet_id IN (SELECT wallet_id FROM os_changed_wallets)")
+            conn.execute("""
+                INSERT INTO src_opensanctions_wallets (wallet_id, address, currency, holder_id, last_change)
+                SELECT wallet_id, address, currency, holder_id, last_change
+                FROM stg_os_wallets
+                WHERE wallet_id IN (SELECT wallet_id FROM os_changed_wallets)
+            """)
+            conn.execute("""
+                DELETE FROM src_opensanctions_entities
+                WHERE id IN (SELECT id FROM os_changed_entities UNION ALL SELECT id FROM os_removed_entities)
+            """)
+            conn.execute("""
+                INSERT INTO src_opensanctions_entities (id, name, authority, last_change)
+                SELECT DISTINCT ON (id) id, name, authority, last_change
+                FROM stg_os_entities
+                WHERE id IN (SELECT id FROM os_changed_entities)
+            """)
+
+            # Update/Insert Dim Entities
+            # We construct the OC Search URL
+            conn.execute("""
+                INSERT INTO dim_sanctions_entity (entity_id, name, program, authority, source_url, last_updated, opencorporates_search_url)
+                SELECT
+                    'OS-' || e.id,
+                    e.name,
+                    'OpenSanctions Consolidated',
+                    e.authority,
+                    'https://opensanctions.org/entities/' || e.id,
+                    CAST(e.last_change as TIMESTAMP),
+                    'https://opencorporates.com/companies?q=' || replace(e.name, ' ', '+')
+                FROM src_opensanctions_entities e
+                WHERE e.id IN (SELECT id FROM os_changed_entities)
+                ON CONFLICT (entity_id) DO UPDATE SET
+                    name = EXCLUDED.name,
+                    authority = EXCLUDED.authority,
+                    last_updated = EXCLUDED.last_updated,
+                    opencorporates_search_url = EXCLUDED.opencorporates_search_url
+            """)
+
+            # Re-derive whatever addresses are missing: those of changed
+            # wallets, plus any shared with a wallet deleted above.
+            # Filter duplicates: OpenSanctions may repeat an address across wallets.
+            added = conn.execute(f"""
+                INSERT INTO fact_sanctioned_addresses (address, chain, entity_id, listed_date, confidence_score, source_ref)
+                SELECT DISTINCT
+                    w.address,
+                    w.currency,
+                    'OS-' || w.holder_id,
+                    '{timestamp}'::TIMESTAMP,
+                    1.0,
+                    'OpenSanctions'
+                FROM src_opensanctions_wallets w
+                JOIN src_opensanctions_entities e ON w.holder_id = e.id
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM fact_sanctioned_addresses f
+                    WHERE f.source_ref = 'OpenSanctions'
+                      AND f.address = w.address AND f.entity_id = 'OS-' || w.holder_id
+                )
+            """).fetchone()[0]
+
+            conn.execute("""
+                INSERT INTO meta_http_state (url, etag, last_modified, content_length, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (url) DO UPDATE SET
+                    etag = EXCLUDED.etag,
+                    last_modified = EXCLUDED.last_modified,
+                    content_length = EXCLUDED.content_length,
+                    updated_at = EXCLUDED.updated_at
+            """, [OPENSANCTIONS_URL, *validators, timestamp])
+
+            count_after = conn.execute("SELECT count(*) FROM fact_sanctioned_addresses WHERE source_ref = 'OpenSanctions'").fetchone()[0]
+
+        record_rows("opensanctions", "load", added)
+        record_rows("opensanctions", "skipped", skipped)
+
+        logger.info(
+            f"OpenSanctions Import Summary: {changed_entities} entities and {changed_wallets} wallets "
+            f"changed, {removed_entities} entities removed, {skipped} unchanged rows skipped; "
+            f"{added} addresses added, {count_after} total."
+        )
+
         # Cleanup
-        conn.execute("DROP TABLE stg_os_entities")
-        conn.execute("DROP TABLE stg_os_wallets")
-        
+        for table in ("stg_os_entities", "stg_os_wallets", "os_changed_entities", "os_removed_entities", "os_changed_wallets"):
+            conn.execute(f"DROP TABLE {table}")
+
         conn.commit()
         conn.close()
+        return changed_entities + removed_entities + changed_wallets > 0
 
     except Exception as e:
         logger.error(f"OpenSanctions Ingest Failed: {e}")
-        # Ensure cleanup
-        try:
-            conn = get_db_connection()
-            conn.execute("DROP TABLE IF EXISTS stg_os_entities")
-            conn.execute("DROP TABLE IF EXISTS stg_os_wallets")
-            conn.close()
-        except:
-            pass
+        conn.close()
         raise e
 
+def fetch_and_load_opensanctions():
+    load_opensanctions(fetch_opensanctions())
+
 def ingest_opensanctions():
     fetch_and_load_opensanctions()
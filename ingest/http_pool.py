@@ -0,0 +1,78 @@
+import time
+import random
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying; anything else is raised straight away
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: allows `rate` requests per second on
+    average and bursts of up to `burst`.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def make_session(pool_size):
+    """
+    A requests session whose keep-alive pool holds a connection per
+    worker, to be shared by all of them.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+def get_json(session, url, limiter, retries=4, backoff=1.0, timeout=30):
+    """
+    GETs `url` through the rate limiter and returns the decoded JSON.
+    Connection errors, timeouts and RETRY_STATUSES are retried with
+    exponential backoff and jitter (or the server's Retry-After).
+    """
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        delay = None
+        try:
+            response = session.get(url, timeout=timeout)
+            if response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                return response.json()
+            error = requests.HTTPError(f"{response.status_code} for {url}", response=response)
+            delay = _retry_after(response)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        if attempt == retries:
+            raise error
+        if delay is None:
+            delay = backoff * 2 ** attempt * (0.5 + random.random())
+        logger.warning(f"GET {url} failed ({error}); retrying in {delay:.1f}s")
+        time.sleep(delay)
@@ -0,0 +1,51 @@
+import time
+import logging
+from contextlib import contextmanager
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+def to_arrow(rows, columns):
+    """
+    Builds an Arrow table from row tuples, one column at a time.
+    DataFrames and Arrow tables are passed through.
+    """
+    if isinstance(rows, pa.Table):
+        return rows
+    if hasattr(rows, "columns") and hasattr(rows, "dtypes"):
+        return pa.Table.from_pandas(rows, preserve_index=False)
+    values = list(zip(*rows)) if rows else [[] for _ in columns]
+    return pa.table({name: pa.array(column) for name, column in zip(columns, values)})
+
+@contextmanager
+def staged(conn, name, rows, columns=None):
+    """
+    Registers `rows` with DuckDB as the relation `name` for the duration
+    of the block, so statements can read them with a plain SELECT.
+    """
+    table = to_arrow(rows, columns)
+    conn.register(name, table)
+    try:
+        yield table
+    finally:
+        conn.unregister(name)
+
+def bulk_load(conn, target, rows, columns, sql=None, params=None, name="stg_rows"):
+    """
+    Loads `rows` (tuples in `columns` order, a DataFrame or an Arrow table)
+    into `target` with a single INSERT ... SELECT from a registered Arrow
+    table. `sql` replaces that statement (e.g. for an upsert) and reads
+    the rows from `name`. Returns the number of rows the statement wrote.
+    """
+    if len(rows) == 0:
+        return 0
+    start = time.perf_counter()
+    with staged(conn, name, rows, columns):
+        if sql is None:
+            column_list = ", ".join(columns)
+            sql = f"INSERT INTO {target} ({column_list}) SELECT {column_list} FROM {name}"
+        count = conn.execute(sql, params or []).fetchone()[0]
+    elapsed = time.perf_counter() - start
+    rate = f"{count / elapsed:,.0f}" if elapsed > 0 else "n/a"
+    logger.info(f"Loaded {count} rows into {target} in {elapsed:.2f}s ({rate} rows/s)")
+    return count
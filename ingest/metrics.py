@@ -0,0 +1,91 @@
+import os
+import time
+import logging
+from contextlib import contextmanager
+from prometheus_client import CollectorRegistry, Gauge, write_to_textfile
+from prometheus_client.parser import text_string_to_metric_families
+from api.metrics import INGEST_METRICS_PATH
+
+logger = logging.getLogger(__name__)
+
+# Ingest is a batch job, so it reports last-run gauges rather than
+# histograms. They are written to a textfile the API serves on /metrics.
+INGEST_REGISTRY = CollectorRegistry()
+
+STAGE_SECONDS = Gauge(
+    "stabletrace_ingest_stage_duration_seconds",
+    "Duration of the last run of each connector stage (fetch, parse, load).",
+    ["connector", "stage"],
+    registry=INGEST_REGISTRY,
+)
+STAGE_ROWS = Gauge(
+    "stabletrace_ingest_stage_rows",
+    "Rows handled by the last run of each connector stage.",
+    ["connector", "stage"],
+    registry=INGEST_REGISTRY,
+)
+LAST_SUCCESS = Gauge(
+    "stabletrace_ingest_last_success_timestamp_seconds",
+    "Unix time each connector last finished loading.",
+    ["connector"],
+    registry=INGEST_REGISTRY,
+)
+
+GAUGES = {
+    "stabletrace_ingest_stage_duration_seconds": STAGE_SECONDS,
+    "stabletrace_ingest_stage_rows": STAGE_ROWS,
+    "stabletrace_ingest_last_success_timestamp_seconds": LAST_SUCCESS,
+}
+
+# Connectors that reported during this process
+_connectors = set()
+
+# Stage durations of this process, {(connector, stage): seconds}
+_timings = {}
+
+@contextmanager
+def stage(connector, name):
+    """
+    Times one stage of a connector run.
+    """
+    _connectors.add(connector)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(connector, name).set(elapsed)
+        _timings[(connector, name)] = elapsed
+        logger.info(f"{connector} {name} took {elapsed:.2f}s")
+
+def record_rows(connector, name, rows):
+    _connectors.add(connector)
+    STAGE_ROWS.labels(connector, name).set(rows)
+
+def record_success(connector):
+    _connectors.add(connector)
+    LAST_SUCCESS.labels(connector).set(time.time())
+
+def stage_timings(connector):
+    """
+    {stage: seconds} for the stages `connector` ran in this process.
+    """
+    return {name: seconds for (c, name), seconds in _timings.items() if c == connector}
+
+def write_ingest_metrics(path=INGEST_METRICS_PATH):
+    """
+    Writes this run's metrics for the API to expose. Series of connectors
+    that didn't run this time are carried over from the previous file, so
+    a single-source run doesn't erase the others.
+    """
+    if os.path.exists(path):
+        with open(path) as f:
+            previous = f.read()
+        for family in text_string_to_metric_families(previous):
+            gauge = GAUGES.get(family.name)
+            if gauge is None:
+                continue
+            for sample in family.samples:
+                if sample.labels.get("connector") not in _connectors:
+                    gauge.labels(**sample.labels).set(sample.value)
+    write_to_textfile(path, INGEST_REGISTRY)
@@ -0,0 +1,174 @@
+import argparse
+import logging
+from datetime import datetime
+from api.db import get_db_connection, init_db, bump_generation, publish_snapshot
+from ingest.loader import bulk_load
+
+logger = logging.getLogger(__name__)
+
+def refresh_supply_daily(conn, timestamps):
+    """
+    Recomputes agg_supply_daily for the days covered by `timestamps`.
+    Callers pass the timestamps of every fact_supply row they inserted or
+    deleted, so only those days are re-aggregated.
+    """
+    timestamps = [t for t in timestamps if t is not None]
+    if not timestamps:
+        return 0
+
+    days = sorted({datetime(t.year, t.month, t.day) for t in timestamps})
+    conn.execute("CREATE OR REPLACE TEMP TABLE tmp_rollup_days AS SELECT unnest(?::TIMESTAMP[]) AS day", [days])
+
+    conn.execute("DELETE FROM agg_supply_daily WHERE day IN (SELECT day FROM tmp_rollup_days)")
+    # The timestamp range lets DuckDB skip row groups outside the touched days
+    conn.execute("""
+        INSERT INTO agg_supply_daily (day, total_supply, updated_at)
+        SELECT
+            date_trunc('day', timestamp) as day,
+            SUM(supply) as total_supply,
+            ?
+        FROM fact_supply
+        WHERE source = 'defillama'
+          AND timestamp >= ? AND timestamp < ? + INTERVAL 1 DAY
+          AND date_trunc('day', timestamp) IN (SELECT day FROM tmp_rollup_days)
+        GROUP BY day
+    """, [datetime.now(), days[0], days[-1]])
+
+    conn.execute("DROP TABLE tmp_rollup_days")
+    return len(days)
+
+def rebuild_supply_daily(conn):
+    """
+    Rebuilds agg_supply_daily from scratch. Use for repairs.
+    """
+    conn.execute("DELETE FROM agg_supply_daily")
+    conn.execute("""
+        INSERT INTO agg_supply_daily (day, total_supply, updated_at)
+        SELECT
+            date_trunc('day', timestamp) as day,
+            SUM(supply) as total_supply,
+            ?
+        FROM fact_supply
+        WHERE source = 'defillama'
+        GROUP BY day
+    """, [datetime.now()])
+    return conn.execute("SELECT COUNT(*) FROM agg_supply_daily").fetchone()[0]
+
+def rank_current_supply(conn):
+    """
+    Recomputes supply_rank (1 = largest) within each chain.
+    current_supply holds one row per asset and chain, so this is cheap.
+    """
+    conn.execute("""
+        UPDATE current_supply
+        SET supply_rank = r.rnk
+        FROM (
+            SELECT asset_id, chain, ROW_NUMBER() OVER (PARTITION BY chain ORDER BY supply DESC) AS rnk
+            FROM current_supply
+        ) r
+        WHERE current_supply.asset_id = r.asset_id AND current_supply.chain = r.chain
+    """)
+
+def upsert_current_supply(conn, supply_rows):
+    """
+    Applies freshly ingested supply rows to current_supply.
+    `supply_rows` use the fact_supply insert layout:
+    (timestamp, asset_id, chain, supply, source, ingested_at).
+    The existing value moves to prev_supply; older points are ignored.
+    """
+    rows = [(r[0], r[1], r[2], r[3]) for r in supply_rows if r[4] == "defillama"]
+    if not rows:
+        return
+
+    bulk_load(conn, "current_supply", rows, ["timestamp", "asset_id", "chain", "supply"], name="tmp_current_supply", params=[datetime.now()], sql="""
+        INSERT INTO current_supply (asset_id, chain, supply, timestamp, updated_at)
+        SELECT asset_id, chain, arg_max(supply, timestamp), max(timestamp), ?
+        FROM tmp_current_supply
+        GROUP BY asset_id, chain
+        ON CONFLICT (asset_id, chain) DO UPDATE SET
+            prev_supply = current_supply.supply,
+            prev_timestamp = current_supply.timestamp,
+            supply = EXCLUDED.supply,
+            timestamp = EXCLUDED.timestamp,
+            updated_at = EXCLUDED.updated_at
+        WHERE EXCLUDED.timestamp > current_supply.timestamp
+    """)
+    rank_current_supply(conn)
+
+def rebuild_current_supply(conn, asset_ids=None):
+    """
+    Recomputes current_supply from fact_supply, for `asset_ids` only if given.
+    Used after history rewrites (backfill) and for repairs.
+    """
+    asset_filter = ""
+    params = []
+    if asset_ids is not None:
+        asset_ids = list(asset_ids)
+        if not asset_ids:
+            return
+        asset_filter = "AND asset_id IN (SELECT unnest(?::VARCHAR[]))"
+        params.append(asset_ids)
+        conn.execute("DELETE FROM current_supply WHERE asset_id IN (SELECT unnest(?::VARCHAR[]))", [asset_ids])
+    else:
+        conn.execute("DELETE FROM current_supply")
+
+    conn.execute(f"""
+        INSERT INTO current_supply (asset_id, chain, supply, timestamp, prev_supply, prev_timestamp, updated_at)
+        WITH ranked AS (
+            SELECT
+                asset_id, chain, supply, timestamp,
+                ROW_NUMBER() OVER (PARTITION BY asset_id, chain ORDER BY timestamp DESC) as rn
+            FROM fact_supply
+            WHERE source = 'defillama' {asset_filter}
+        )
+        SELECT
+            asset_id, chain,
+            max(supply) FILTER (WHERE rn = 1),
+            max(timestamp) FILTER (WHERE rn = 1),
+            max(supply) FILTER (WHERE rn = 2),
+            max(timestamp) FILTER (WHERE rn = 2),
+            ?
+        FROM ranked
+        WHERE rn <= 2
+        GROUP BY asset_id, chain
+    """, params + [datetime.now()])
+    rank_current_supply(conn)
+
+def ensure_rollups(conn):
+    """
+    Populates the rollups on databases created before they existed.
+    """
+    if conn.execute("SELECT COUNT(*) FROM fact_supply").fetchone()[0] == 0:
+        return
+    if conn.execute("SELECT COUNT(*) FROM agg_supply_daily").fetchone()[0] == 0:
+        logger.info("agg_supply_daily is empty, building it from fact_supply...")
+        rebuild_supply_daily(conn)
+    if conn.execute("SELECT COUNT(*) FROM current_supply").fetchone()[0] == 0:
+        logger.info("current_supply is empty, building it from fact_supply...")
+        rebuild_current_supply(conn)
+
+def rebuild_rollups():
+    init_db()
+    conn = get_db_connection()
+    try:
+        days = rebuild_supply_daily(conn)
+        rebuild_current_supply(conn)
+        # Rollups feed the supply routes, which are cached per defillama generation
+        bump_generation(conn, "defillama")
+        conn.commit()
+        logger.info(f"Rebuilt agg_supply_daily ({days} days) and current_supply.")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Maintain StableTrace rollup tables")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild all rollups from the fact tables")
+
+    args = parser.parse_args()
+
+    if args.rebuild:
+        with publish_snapshot():
+            rebuild_rollups()
+    else:
+        parser.print_help()
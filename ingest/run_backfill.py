@@ -1,15 +1,36 @@
 import logging
 import sys
 import os
+import argparse
 
 # Add project root to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from ingest.connectors.defillama import backfill_history
+from ingest.connectors.defillama import backfill_history, BACKFILL_WORKERS, BACKFILL_RATE, BACKFILL_BATCH_ROWS
+from api.db import init_db, publish_snapshot
+from ingest.run_ingest import mark_source_loaded
+from ingest.metrics import stage, record_rows, write_ingest_metrics
 
 logging.basicConfig(level=logging.INFO)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill DefiLlama supply history")
+    parser.add_argument("--limit", type=int, help="Only the top N assets by circulating supply (default: all)")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help=f"Concurrent fetches (default: {BACKFILL_WORKERS})")
+    parser.add_argument("--rate", type=float, default=BACKFILL_RATE, help=f"Max requests per second (default: {BACKFILL_RATE})")
+    parser.add_argument("--batch-rows", type=int, default=BACKFILL_BATCH_ROWS, help=f"Rows per bulk write (default: {BACKFILL_BATCH_ROWS})")
+    parser.add_argument("--full", action="store_true", help="Re-load every asset's full history instead of only points past its high-water mark")
+
+    args = parser.parse_args()
+
     print("Running backfill...")
-    backfill_history(limit=15) # Top 15 slightly better coverage
+    with publish_snapshot():
+        # Creates meta_backfill_state on databases that predate it
+        init_db()
+        # Fetches and loads overlap, so time the run as one stage
+        with stage("defillama", "backfill"):
+            rows = backfill_history(args.limit, args.workers, args.rate, args.batch_rows, args.full)
+        record_rows("defillama", "backfill", rows)
+        mark_source_loaded("defillama")
+    write_ingest_metrics()
     print("Done.")
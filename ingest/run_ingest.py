@@ -1,8 +1,13 @@
 import sys
 import os
+import time
 import argparse
 import logging
-from api.db import init_db
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from api.db import init_db, get_db_connection, bump_generation, publish_snapshot
+from ingest.rollups import ensure_rollups
+from ingest.search_index import ensure_search_index, rebuild_search_index
+from ingest.metrics import record_success, stage_timings, write_ingest_metrics
 
 # Configure logging
 logging.basicConfig(
@@ -11,54 +16,219 @@ logging.basicConfig(
 )
 logger = logging.getLogger("ingest")
 
+def mark_source_loaded(source, changed=True):
+    """
+    Records a successful load of `source`. If it brought new data
+    (`changed`), also bumps the source's data generation so API-side
+    derived state (e.g. the screening index) is rebuilt.
+    """
+    if changed:
+        conn = get_db_connection()
+        try:
+            bump_generation(conn, source)
+            conn.commit()
+        finally:
+            conn.close()
+    # An unchanged source is still fresh
+    record_success(source)
+
+def _defillama():
+    from ingest.connectors.defillama import fetch_defillama, save_defillama
+    return fetch_defillama, save_defillama
+
+def _coingecko():
+    from ingest.connectors.coingecko import fetch_coingecko, save_coingecko
+    return fetch_coingecko, save_coingecko
+
+def _ofac():
+    from ingest.connectors.sanctions_ofac import fetch_ofac, save_ofac
+    return fetch_ofac, save_ofac
+
+def _opensanctions():
+    from ingest.connectors.sanctions_opensanctions import fetch_opensanctions, load_opensanctions
+    return fetch_opensanctions, load_opensanctions
+
+def _cryptoscamdb():
+    from ingest.connectors.risk_cryptoscamdb import fetch_and_parse_cryptoscamdb, save_cryptoscamdb
+    return fetch_and_parse_cryptoscamdb, save_cryptoscamdb
+
+# (source, --source values selecting it, label, (fetch, save) loader,
+# whether a failure is logged rather than aborting a sequential run).
+# fetch() covers the fetch and parse stages and must not write to the
+# database; save() does the load stage and returns False when the source
+# had nothing new, so its generation (and the API caches) stay put while
+# its last-success timestamp still advances.
+CONNECTORS = [
+    ("defillama", ("defillama",), "DefiLlama", _defillama, False),
+    ("coingecko", ("coingecko",), "CoinGecko", _coingecko, False),
+    ("ofac", ("sanctions", "ofac"), "Sanctions (OFAC)", _ofac, False),
+    ("opensanctions", ("sanctions", "opensanctions"), "Sanctions (OpenSanctions)", _opensanctions, True),
+    # Deprecated standalone UK/UN in favor of OpenSanctions
+    ("cryptoscamdb", ("risk", "cryptoscamdb"), "CryptoScamDB", _cryptoscamdb, True),
+]
+
+# Sources whose load reads what another source's load wrote: CoinGecko
+# matches coins against the dim_assets rows DefiLlama writes. A source
+# is only loaded after its dependencies in the same run, and is skipped
+# if one of them failed.
+DEPENDS_ON = {
+    "coingecko": ("defillama",),
+}
+
+SANCTIONS_SELECTORS = (None, "sanctions", "ofac", "opensanctions", "risk", "cryptoscamdb")
+
 def run_defillama_ingest():
-    from ingest.connectors.defillama import ingest_defillama
+    fetch, save = _defillama()
     logger.info("Starting DefiLlama ingest...")
-    ingest_defillama()
+    save(fetch())
+    mark_source_loaded("defillama")
     logger.info("DefiLlama ingest complete.")
 
-def run_pipeline(source=None):
+def run_pipeline(source=None, parallel=False):
+    """
+    Runs the connectors against a staging copy of the database and
+    publishes it for the API once they finish (see publish_snapshot).
+    Returns {source: exception} for sources that failed without
+    aborting the run.
+    """
+    try:
+        with publish_snapshot():
+            return _run_pipeline(source, parallel)
+    finally:
+        # Stage timings and row counts are served by the API on /metrics
+        write_ingest_metrics()
+
+def _run_pipeline(source, parallel):
     # Ensure DB is ready
     init_db()
-    
-    if source == "defillama" or source is None:
-        run_defillama_ingest()
-    
-    if source == "coingecko" or source is None:
-        from ingest.connectors.coingecko import ingest_coingecko
-        logger.info("Starting CoinGecko ingest...")
-        ingest_coingecko()
-        logger.info("CoinGecko ingest complete.")
-
-    if source == "sanctions" or source == "ofac" or source is None:
-        from ingest.connectors.sanctions_ofac import ingest_ofac
-        logger.info("Starting Sanctions (OFAC) ingest...")
-        ingest_ofac()
-        logger.info("Sanctions (OFAC) ingest complete.")
-
-    if source == "sanctions" or source == "opensanctions" or source is None:
+    conn = get_db_connection()
+    try:
+        ensure_rollups(conn)
+        ensure_search_index(conn)
+    finally:
+        conn.close()
+
+    selected = [c for c in CONNECTORS if source is None or source in c[1]]
+
+    start = time.perf_counter()
+    if parallel:
+        failures = run_parallel(selected)
+        if len(failures) == len(selected):
+            # Nothing new to publish
+            raise RuntimeError(f"All ingest sources failed: {', '.join(failures)}")
+    else:
+        failures = run_sequential(selected)
+    log_summary(selected, time.perf_counter() - start, failures)
+
+    if source in SANCTIONS_SELECTORS:
+        logger.info("Rebuilding sanctions search index...")
+        conn = get_db_connection()
         try:
-            from ingest.connectors.sanctions_opensanctions import ingest_opensanctions
-            logger.info("Starting Sanctions (OpenSanctions) ingest...")
-            ingest_opensanctions()
-        except Exception as e:
-            logger.error(f"Error during OpenSanctions ingest: {e}")
-            
-    # Deprecated standalone UK/UN in favor of OpenSanctions
-    # if source == "uk": ...
+            rebuild_search_index(conn)
+            conn.commit()
+        finally:
+            conn.close()
+    return failures
+
+def _failed_dependency(source, failures):
+    return next((d for d in DEPENDS_ON.get(source, ()) if d in failures), None)
 
-    if source == "risk" or source == "cryptoscamdb" or source is None:
+def run_sequential(selected):
+    failures = {}
+    for source, _, label, connector, isolated in selected:
         try:
-            from ingest.connectors.risk_cryptoscamdb import ingest_cryptoscamdb
-            logger.info("Starting CryptoScamDB ingest...")
-            ingest_cryptoscamdb()
+            dependency = _failed_dependency(source, failures)
+            if dependency:
+                raise RuntimeError(f"skipped, {dependency} failed")
+            fetch, save = connector()
+            logger.info(f"Starting {label} ingest...")
+            mark_source_loaded(source, changed=save(fetch()) is not False)
+            logger.info(f"{label} ingest complete.")
         except Exception as e:
-            logger.error(f"Error during CryptoScamDB ingest: {e}")
+            if not isolated:
+                raise
+            logger.error(f"Error during {label} ingest: {e}")
+            failures[source] = e
+    return failures
+
+def run_parallel(selected):
+    """
+    Runs the fetch and parse stages of all connectors concurrently in
+    threads. Loads run one at a time on the calling thread as fetches
+    complete, so DuckDB keeps a single writer, and never before the
+    loads of their DEPENDS_ON sources in this run. A failing source is
+    logged and skipped without affecting the others, except for sources
+    depending on it.
+    """
+    failures = {}
+    futures = {}
+    selected_sources = {c[0] for c in selected}
+    with ThreadPoolExecutor(max_workers=len(selected), thread_name_prefix="ingest-fetch") as pool:
+        for source, _, label, connector, _ in selected:
+            try:
+                fetch, save = connector()
+            except Exception as e:
+                logger.error(f"Error during {label} ingest: {e}")
+                failures[source] = e
+                continue
+            logger.info(f"Starting {label} ingest...")
+            futures[pool.submit(fetch)] = (source, label, save)
+
+        loaded = set()
+        fetched = []
+        for future in as_completed(futures):
+            fetched.append(future)
+            # Load everything whose dependencies are settled, in the order
+            # fetches completed; a load can unblock ones fetched earlier
+            progress = True
+            while progress:
+                progress = False
+                for ready in list(fetched):
+                    source, label, save = futures[ready]
+                    waiting = [
+                        d for d in DEPENDS_ON.get(source, ())
+                        if d in selected_sources and d not in loaded and d not in failures
+                    ]
+                    if waiting:
+                        continue
+                    fetched.remove(ready)
+                    progress = True
+                    try:
+                        dependency = _failed_dependency(source, failures)
+                        if dependency:
+                            raise RuntimeError(f"skipped, {dependency} failed")
+                        mark_source_loaded(source, changed=save(ready.result()) is not False)
+                        loaded.add(source)
+                        logger.info(f"{label} ingest complete.")
+                    except Exception as e:
+                        logger.error(f"Error during {label} ingest: {e}")
+                        failures[source] = e
+    return failures
+
+def log_summary(selected, wall, failures):
+    """
+    Logs each source's stage times and compares the run's wall time with
+    the sum of all stages (the time a strictly sequential run would take).
+    """
+    total = 0.0
+    logger.info("Ingest summary:")
+    for source, *_ in selected:
+        timings = stage_timings(source)
+        total += sum(timings.values())
+        stages = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in timings.items())
+        status = "failed" if source in failures else "ok"
+        logger.info(f"  {source:<14} {status:<7} {stages}")
+    speedup = f" ({total / wall:.1f}x)" if wall > 0 else ""
+    logger.info(f"Wall time {wall:.1f}s, stages summed {total:.1f}s{speedup}.")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run StableTrace Ingest Pipeline")
     parser.add_argument("--source", type=str, help="Specific source to run (default: all)", choices=["defillama", "coingecko", "sanctions", "ofac", "opensanctions", "risk", "cryptoscamdb"])
+    parser.add_argument("--parallel", action="store_true", help="Fetch and parse all sources concurrently; loads stay serialized")
     
     args = parser.parse_args()
     
-    run_pipeline(args.source)
+    failures = run_pipeline(args.source, args.parallel)
+    # Sequential runs abort on the core sources instead
+    if args.parallel and failures:
+        sys.exit(1)
@@ -0,0 +1,99 @@
+import argparse
+import logging
+from api.db import get_db_connection, init_db, publish_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Must stay in sync with api.search.normalize_name: lowercase, runs of
+# anything that isn't a letter or digit collapse to one space.
+NAME_NORM_SQL = r"trim(regexp_replace(lower(name), '[^\pL\pN]+', ' ', 'g'))"
+
+def rebuild_search_index(conn):
+    """
+    Rebuilds the sanctions search tables from dim_sanctions_entity and
+    fact_sanctioned_addresses. All are written sorted on their lookup
+    key so DuckDB's zone maps can skip most row groups.
+    """
+    conn.execute("DELETE FROM search_addresses")
+    conn.execute("""
+        INSERT INTO search_addresses (address_lc, address, entity_id)
+        SELECT DISTINCT lower(address), address, entity_id
+        FROM fact_sanctioned_addresses
+        WHERE address IS NOT NULL
+        ORDER BY 1
+    """)
+
+    conn.execute("DELETE FROM search_name_trigrams")
+    conn.execute("DELETE FROM search_names")
+    # Names are padded with a space on each side, as in pg_trgm, so word
+    # starts produce their own trigrams (' ho' for 'holdings').
+    conn.execute(f"""
+        CREATE OR REPLACE TEMP TABLE tmp_search_names AS
+        SELECT entity_id, ' ' || {NAME_NORM_SQL} || ' ' AS padded
+        FROM dim_sanctions_entity
+        WHERE name IS NOT NULL AND {NAME_NORM_SQL} <> ''
+    """)
+    conn.execute("""
+        INSERT INTO search_name_trigrams (trigram, entity_id)
+        SELECT DISTINCT substring(padded, i, 3) AS trigram, entity_id
+        FROM (
+            SELECT entity_id, padded, unnest(range(1, length(padded) - 1)) AS i
+            FROM tmp_search_names
+        )
+        ORDER BY trigram
+    """)
+    conn.execute("""
+        INSERT INTO search_names (entity_id, name_norm, trigram_count)
+        SELECT n.entity_id, trim(n.padded), COUNT(t.trigram)
+        FROM tmp_search_names n
+        JOIN search_name_trigrams t ON t.entity_id = n.entity_id
+        GROUP BY n.entity_id, n.padded
+    """)
+    conn.execute("DROP TABLE tmp_search_names")
+
+    # Per-entity sort key of the unfiltered sanctions list, so its pages
+    # are a range read instead of an aggregation over every address
+    conn.execute("DELETE FROM search_entity_order")
+    conn.execute("""
+        INSERT INTO search_entity_order (entity_id, authority, latest)
+        SELECT f.entity_id, e.authority, COALESCE(MAX(f.listed_date), TIMESTAMP '1970-01-01')
+        FROM fact_sanctioned_addresses f
+        JOIN dim_sanctions_entity e ON f.entity_id = e.entity_id
+        GROUP BY f.entity_id, e.authority
+        ORDER BY 3 DESC, 1 DESC
+    """)
+
+    names = conn.execute("SELECT COUNT(*) FROM search_names").fetchone()[0]
+    addresses = conn.execute("SELECT COUNT(*) FROM search_addresses").fetchone()[0]
+    logger.info(f"Search index rebuilt: {names} entity names, {addresses} addresses.")
+
+def ensure_search_index(conn):
+    """
+    Builds the search index on databases created before it existed.
+    """
+    empty = any(
+        conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0
+        for table in ("search_names", "search_entity_order")
+    )
+    if empty and conn.execute("SELECT COUNT(*) FROM dim_sanctions_entity").fetchone()[0] > 0:
+        logger.info("Search index is empty, building it...")
+        rebuild_search_index(conn)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Maintain the StableTrace sanctions search index")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the search index from the sanctions tables")
+
+    args = parser.parse_args()
+
+    if args.rebuild:
+        with publish_snapshot():
+            init_db()
+            conn = get_db_connection()
+            try:
+                rebuild_search_index(conn)
+                conn.commit()
+            finally:
+                conn.close()
+    else:
+        parser.print_help()
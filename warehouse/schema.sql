@@ -31,6 +31,29 @@ CREATE TABLE IF NOT EXISTS fact_prices (
     ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Rollups (maintained incrementally by ingest, see ingest/rollups.py)
+
+CREATE TABLE IF NOT EXISTS agg_supply_daily (
+    day TIMESTAMP PRIMARY KEY,
+    total_supply DOUBLE,
+    updated_at TIMESTAMP
+);
+
+-- Latest supply per asset and chain, with the previous value for deltas
+CREATE TABLE IF NOT EXISTS current_supply (
+    asset_id VARCHAR,
+    chain VARCHAR,
+    supply DOUBLE,
+    timestamp TIMESTAMP,
+    prev_supply DOUBLE,
+    prev_timestamp TIMESTAMP,
+    supply_rank INTEGER,
+    updated_at TIMESTAMP,
+    PRIMARY KEY (asset_id, chain)
+);
+
+CREATE INDEX IF NOT EXISTS idx_current_supply_rank ON current_supply (supply_rank);
+
 -- Risk / Enrichment Tables
 
 CREATE TABLE IF NOT EXISTS fact_events (
@@ -57,5 +80,75 @@ CREATE TABLE IF NOT EXISTS fact_sanctioned_addresses (
     chain VARCHAR,
     entity_id VARCHAR,
     listed_date TIMESTAMP,
-    confidence_score DOUBLE
+    confidence_score DOUBLE,
+    source_ref VARCHAR
+);
+
+-- Search Index (rebuilt after sanctions ingest, see ingest/search_index.py)
+
+CREATE TABLE IF NOT EXISTS search_addresses (
+    address_lc VARCHAR,
+    address VARCHAR,
+    entity_id VARCHAR
+);
+
+CREATE TABLE IF NOT EXISTS search_names (
+    entity_id VARCHAR PRIMARY KEY,
+    name_norm VARCHAR,
+    trigram_count INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS search_name_trigrams (
+    trigram VARCHAR,
+    entity_id VARCHAR
+);
+
+-- Browse order of /risk/sanctions/latest: one row per listed entity
+CREATE TABLE IF NOT EXISTS search_entity_order (
+    entity_id VARCHAR,
+    authority VARCHAR,
+    latest TIMESTAMP
+);
+
+-- Ingest Bookkeeping
+
+CREATE TABLE IF NOT EXISTS meta_source_generation (
+    source VARCHAR PRIMARY KEY,
+    generation BIGINT,
+    updated_at TIMESTAMP
+);
+
+-- HTTP validators of the last loaded download, for conditional GETs
+CREATE TABLE IF NOT EXISTS meta_http_state (
+    url VARCHAR PRIMARY KEY,
+    etag VARCHAR,
+    last_modified VARCHAR,
+    content_length BIGINT,
+    updated_at TIMESTAMP
+);
+
+-- OpenSanctions wallets and holders as last loaded, so ingest only
+-- applies records whose last_change moved (see sanctions_opensanctions.py)
+CREATE TABLE IF NOT EXISTS src_opensanctions_entities (
+    id VARCHAR PRIMARY KEY,
+    name VARCHAR,
+    authority VARCHAR,
+    last_change TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS src_opensanctions_wallets (
+    wallet_id VARCHAR,
+    address VARCHAR,
+    currency VARCHAR,
+    holder_id VARCHAR,
+    last_change TIMESTAMP
+);
+
+-- Newest history point loaded per asset, so backfills only add what's new
+CREATE TABLE IF NOT EXISTS meta_backfill_state (
+    asset_id VARCHAR,
+    source VARCHAR,
+    high_water_mark TIMESTAMP,
+    updated_at TIMESTAMP,
+    PRIMARY KEY (asset_id, source)
 );